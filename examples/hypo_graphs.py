@@ -22,7 +22,7 @@ def test_remove_add(eds):
       G = Graph()
       for (a,b) in eds:
           G.add_edge(a, b)
-      edge = G.edges()[0]
+      edge = next(iter(G.edges()))
       edges_1 = set(G.edges())
       G.remove_edge(*edge)
       G.add_edge(*edge)
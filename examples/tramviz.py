@@ -17,15 +17,13 @@ gbg_linecolors = {
 
 def scaled_position(network):
 
-    # compute the scale of the map
-    minlat, minlon, maxlat, maxlon = network.extreme_positions()
-    size_x = maxlon - minlon
+    # compute the scale of the map from the precomputed planar positions in km
+    size_x, size_y = network.projected_size()
     scalefactor = len(network)/3
     x_factor = scalefactor/size_x
-    size_y = maxlat - minlat
     y_factor = scalefactor/size_y
     
-    return lambda xy: (x_factor*(xy[0]-minlon), y_factor*(xy[1]-minlat))
+    return lambda xy: (x_factor*xy[0], y_factor*xy[1])
 
 # to generate https://www.google.com/search?q=Prinsgatan+Gothenburg
 import urllib.parse
@@ -40,7 +38,7 @@ def network_graphviz(network, colors=None, positions=None):
 
     for stop in network.all_stops():
         
-        x, y = network.stop_position(stop)
+        x, y = network.projected_position(stop)
         if positions:
             x, y = positions((x, y))
         pos_x, pos_y = str(x), str(y)
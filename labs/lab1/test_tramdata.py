@@ -165,5 +165,48 @@ class TestTramData(unittest.TestCase):
         self.assertFalse(result, msg="Invalid query should return False.")
 
 
+
+class TestTimetable(unittest.TestCase):
+
+    def setUp(self):
+        # the lines file next to the test, holding the same lines as the JSON
+        self.timetable = build_timetable('tramlines.txt', headway=10, first='09:00', last='12:00')
+        with open(TRAM_FILE) as trams:
+            self.tramdict = json.loads(trams.read())
+
+    def test_connections_sorted(self):
+        departures = [connection[0] for connection in self.timetable]
+        self.assertEqual(departures, sorted(departures))
+
+    def test_direct_trip(self):
+        legs = earliest_arrival(self.timetable, 'Östra Sjukhuset', 'Tingvallsvägen', parse_clock('10:00'))
+        self.assertEqual(legs, [('1', 'Östra Sjukhuset', 600, 'Tingvallsvägen', 601)])
+
+    def test_waits_for_next_departure(self):
+        legs = earliest_arrival(self.timetable, 'Östra Sjukhuset', 'Tingvallsvägen', parse_clock('10:01'))
+        self.assertEqual(legs[0][2], 610)
+
+    def test_legs_are_connected(self):
+        legs = earliest_arrival(self.timetable, 'Opaltorget', 'Angered Centrum', parse_clock('10:00'), change_time=2)
+        self.assertEqual(legs[0][1], 'Opaltorget')
+        self.assertEqual(legs[-1][3], 'Angered Centrum')
+        for leg, next_leg in zip(legs, legs[1:]):
+            self.assertEqual(leg[3], next_leg[1])
+            self.assertGreaterEqual(next_leg[2], leg[4] + 2)
+
+    def test_no_needless_change(self):
+        # riding one stop out to meet the same line coming back arrives no earlier
+        legs = earliest_arrival(self.timetable, 'Chalmers', 'Angered Centrum', parse_clock('10:03'))
+        self.assertEqual([(leg[0], leg[1]) for leg in legs], [('8', 'Chalmers')])
+
+    def test_unreachable_after_service(self):
+        self.assertIsNone(earliest_arrival(self.timetable, 'Östra Sjukhuset', 'Opaltorget', parse_clock('23:00')))
+
+    def test_route_query(self):
+        result = answer_query(self.tramdict, "route from östra sjukhuset to tingvallsvägen at 10:00",
+                              self.timetable)
+        self.assertEqual(result, "line 1 from Östra Sjukhuset 10:00 to Tingvallsvägen 10:01")
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,148 @@
+import os
+import random
+import sys
+import time
+import tempfile
+import timeit
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from graphs import WeightedGraph, betweenness_centrality, dijkstra, pareto_paths
+from trams import build_tram_network, tram_network_from_dict
+
+TRAM_FILE = 'tramnetwork.json'
+
+
+def best_of(function, repeat=5, number=10):
+    """
+    Return the best average time in milliseconds of a call to function.
+    """
+    return min(timeit.repeat(function, repeat=repeat, number=number)) / number * 1000
+
+
+def bench_save_load(json_file=TRAM_FILE):
+    """
+    Compare loading a saved binary graph with rebuilding it from the lab1 JSON.
+    """
+    network = build_tram_network(json_file, use_cache=False)
+    fd, path = tempfile.mkstemp(suffix='.wgraph')
+    os.close(fd)
+    try:
+        network.save(path)
+        print(f"{len(network)} stops, {network.number_of_edges()} edges, "
+              f"{os.path.getsize(json_file)} bytes JSON, {os.path.getsize(path)} bytes binary")
+        print(f"  build from JSON:  {best_of(lambda: build_tram_network(json_file, use_cache=False)):.3f} ms")
+        build_tram_network(json_file, use_cache=True)
+        print(f"  load from cache:  {best_of(lambda: build_tram_network(json_file, use_cache=True)):.3f} ms")
+        print(f"  load binary:      {best_of(lambda: WeightedGraph.load(path)):.3f} ms")
+    finally:
+        os.remove(path)
+
+
+def bench_betweenness(json_file=TRAM_FILE):
+    """
+    Time exact betweenness serially and on a process pool, and the sampled mode.
+    """
+    network = build_tram_network(json_file)
+    serial = lambda: betweenness_centrality(network, processes=1)
+    pooled = lambda: betweenness_centrality(network, processes=os.cpu_count())
+    sampled = lambda: betweenness_centrality(network, processes=1, samples=len(network) // 4)
+    print(f"  exact, 1 process:    {best_of(serial, repeat=3, number=1):.1f} ms")
+    print(f"  exact, {os.cpu_count()} processes:  {best_of(pooled, repeat=3, number=1):.1f} ms")
+    print(f"  sampled 1/4 sources: {best_of(sampled, repeat=3, number=1):.1f} ms")
+    top = sorted(serial().vertices.items(), key=lambda item: -item[1])[:5]
+    print("  most critical stops:", ', '.join(stop for stop, _ in top))
+
+
+def synthetic_network(n_stops, n_lines, stops_per_line, seed=0):
+    """
+    Return a random network dictionary in the lab1 JSON format.
+    """
+    rng = random.Random(seed)
+    names = [f"Stop {i}" for i in range(n_stops)]
+    stops = {name: {"lat": 57.6 + rng.random() / 5, "lon": 11.9 + rng.random() / 5} for name in names}
+    lines, times = {}, {name: {} for name in names}
+    for line in range(1, n_lines + 1):
+        route = rng.sample(names, min(stops_per_line, n_stops))
+        lines[str(line)] = route
+        for a, b in zip(route, route[1:]):
+            times[a][b] = times[b][a] = rng.randint(1, 4)
+    return {"stops": stops, "lines": lines, "times": times}
+
+
+def bench_build(sizes=((1000, 10, 200), (4000, 40, 200), (16000, 160, 200))):
+    """
+    Build time and memory per stop for synthetic networks of growing size.
+    """
+    for n_stops, n_lines, stops_per_line in sizes:
+        data = synthetic_network(n_stops, n_lines, stops_per_line)
+        tracemalloc.start()
+        network = tram_network_from_dict(data)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        elapsed = best_of(lambda: tram_network_from_dict(data), repeat=3, number=1)
+        print(f"  {n_stops:6} stops, {n_lines:3} lines x {stops_per_line:4} stops: "
+              f"{elapsed:8.1f} ms, {memory / len(network):6.0f} bytes per stop")
+
+
+def bench_frozen_threads(json_file=TRAM_FILE, requests=400, io_wait=0.002):
+    """
+    Throughput of route requests on one shared frozen network with a
+    simulated I/O wait per request, for a growing number of threads.
+    """
+    frozen = build_tram_network(json_file).freeze()
+    stops = frozen.list_all_stops()
+    rng = random.Random(0)
+    pairs = [tuple(rng.sample(stops, 2)) for _ in range(requests)]
+
+    def handle(pair):
+        time.sleep(io_wait)  # stands for reading the request and writing the response
+        return frozen.shortest_path(*pair)
+
+    expected = [frozen.shortest_path(*pair) for pair in pairs]
+    for threads in (1, 2, 4, 8, 16):
+        with ThreadPoolExecutor(threads) as pool:
+            start = time.perf_counter()
+            results = list(pool.map(handle, pairs))
+            elapsed = time.perf_counter() - start
+        assert results == expected
+        print(f"  {threads:2} threads: {requests / elapsed:7.0f} requests/s")
+
+
+def bench_pareto(json_file=TRAM_FILE, pairs=100):
+    """
+    One bi-criteria search against two separate dijkstra searches, by
+    travel time and by distance, for random stop pairs.
+    """
+    network = build_tram_network(json_file)
+    costs = (network.transition_time, network.geo_distance)
+    stops = network.list_all_stops()
+    rng = random.Random(0)
+    pairs = [tuple(rng.sample(stops, 2)) for _ in range(pairs)]
+
+    def two_searches():
+        return [(dijkstra(network, dep, cost=costs[0])[dest], dijkstra(network, dep, cost=costs[1])[dest])
+                for dep, dest in pairs]
+
+    def one_search():
+        return [pareto_paths(network, dep, [dest], costs) for dep, dest in pairs]
+
+    sizes = [len(routes) for routes in one_search()]
+    print(f"  two dijkstra searches: {best_of(two_searches, repeat=3, number=1) / len(pairs):.3f} ms per pair")
+    print(f"  one Pareto search:     {best_of(one_search, repeat=3, number=1) / len(pairs):.3f} ms per pair, "
+          f"{sum(sizes) / len(sizes):.1f} routes on average, at most {max(sizes)}")
+
+
+BENCHMARKS = {
+    'save_load': bench_save_load,
+    'betweenness': bench_betweenness,
+    'build': bench_build,
+    'frozen_threads': bench_frozen_threads,
+    'pareto': bench_pareto,
+}
+
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or BENCHMARKS:
+        print(f"== {name}")
+        BENCHMARKS[name]()
@@ -1,10 +1,33 @@
 import heapq
+import math
+import os
+import random
+import struct
+import sys
+from array import array
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import cached_property
+from itertools import count
 
 from graphviz import Digraph
 
 import networkx as nx
 
 
+class EdgeView(nx.reportviews.EdgeView):
+    """
+    Live view of the edges of a Graph, supporting iteration, len() and
+    `in` for either orientation of an edge. Calling it with as_list=True
+    returns a list copy instead.
+    """
+    __slots__ = ()
+
+    def __call__(self, nbunch=None, data=False, *, default=None, as_list=False):
+        view = super().__call__(nbunch, data, default=default)
+        return list(view) if as_list else view
+
+
 class Graph(nx.Graph):
     def __init__(self, edgelist=None):
         """
@@ -14,23 +37,28 @@ class Graph(nx.Graph):
         if edgelist:
             self.add_edges_from(edgelist)
 
-    def vertices(self):
+    @cached_property
+    def edges(self):
         """
-        Return a list of all vertices in the graph.
+        Live view of the edges in the graph; graph.edges() returns the same
+        view and graph.edges(as_list=True) a list of the edges.
         """
-        return list(self.nodes)
+        return EdgeView(self)
 
-    def edges(self):
+    def vertices(self, as_list=False):
         """
-        Return a list of edges in the graph.
+        Return a live view of all vertices in the graph,
+        or a list of them if as_list is True.
         """
-        return list(super().edges)
+        return list(self.nodes) if as_list else self.nodes
 
-    def neighbors(self, vertex):
+    def neighbors(self, vertex, as_list=False):
         """
-        Return a list of neighbors for a given vertex.
+        Return a live view of the neighbors of a given vertex,
+        or a list of them if as_list is True.
         """
-        return list(self.neighbors(vertex))
+        neighbors = self._adj[vertex].keys()
+        return list(neighbors) if as_list else neighbors
 
     def add_vertex(self, vertex):
         """
@@ -54,7 +82,7 @@ class Graph(nx.Graph):
         """
         Remove an edge between two vertices.
         """
-        self.remove_edge(vertex1, vertex2)
+        super().remove_edge(vertex1, vertex2)
 
     def get_vertex_value(self, vertex):
         """
@@ -101,6 +129,78 @@ class WeightedGraph(Graph):
         """
         self[vertex1][vertex2]["weight"] = weight
 
+    def save(self, path):
+        """
+        Save the graph as a compact binary edge list.
+
+        The file holds a header, a table of vertex names, the int32 endpoint
+        indices of every edge and their float32 weights, in the layout
+        described by GRAPH_HEADER. Vertices are stored as their str() and
+        missing weights as NaN.
+        """
+        index = {}
+        names = []
+        for vertex in self.nodes:
+            index[vertex] = len(names)
+            names.append(str(vertex).encode('utf-8'))
+        strtab = b'\0'.join(names)
+
+        sources, targets, weights = array('i'), array('i'), array('f')
+        for u, v, weight in self.edges.data('weight'):
+            sources.append(index[u])
+            targets.append(index[v])
+            weights.append(math.nan if weight is None else weight)
+        if sys.byteorder != 'little':
+            for column in (sources, targets, weights):
+                column.byteswap()
+
+        with open(path, 'wb') as file:
+            file.write(GRAPH_HEADER.pack(GRAPH_MAGIC, len(names), len(weights), len(strtab)))
+            file.write(strtab)
+            file.write(b'\0' * _padding(GRAPH_HEADER.size + len(strtab)))
+            file.write(sources.tobytes())
+            file.write(targets.tobytes())
+            file.write(weights.tobytes())
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a graph written by save(), rebuilding it edge by edge.
+        """
+        graph = cls()
+        with open(path, 'rb') as file:
+            data = file.read()
+        magic, n_vertices, n_edges, strtab_size = GRAPH_HEADER.unpack_from(data)
+        if magic != GRAPH_MAGIC:
+            raise ValueError(f"{path} is not a saved WeightedGraph.")
+        offset = GRAPH_HEADER.size
+        names = data[offset:offset + strtab_size].decode('utf-8').split('\0') if n_vertices else []
+        offset += strtab_size + _padding(offset + strtab_size)
+
+        columns = []
+        for code in 'iif':
+            column = array(code, data[offset:offset + 4 * n_edges])
+            if sys.byteorder != 'little':
+                column.byteswap()
+            columns.append(column)
+            offset += 4 * n_edges
+
+        graph.add_nodes_from(names)
+        sources, targets, weights = columns
+        graph.add_edges_from(
+            (names[a], names[b]) if math.isnan(w) else (names[a], names[b], {'weight': w})
+            for a, b, w in zip(sources, targets, weights))
+        return graph
+
+
+# binary graph file: magic, vertex count, edge count, size of the name table
+GRAPH_MAGIC = b'WGRAPH\x01\0'
+GRAPH_HEADER = struct.Struct('<8sIII')
+
+
+def _padding(size, alignment=4):
+    return -size % alignment
+
 
 def costs2attributes(G, cost, attr='weight'):
     """
@@ -113,16 +213,221 @@ def costs2attributes(G, cost, attr='weight'):
 def dijkstra(graph, source, cost=None):
     """
     Compute shortest paths from the source vertex to all other vertices.
+
+    The graph only needs neighbors(vertex), and get_weight(a, b) unless a
+    cost function is given, so implicit graphs that generate their edges
+    on demand can be searched too. Edges without a weight cost 1.
+    Nothing is written to the graph.
     """
-    # Apply the cost function to all edges
-    for u, v in graph.edges():
-        graph[u][v]['weight'] = cost(u, v) if cost else graph.get_weight(u, v)
+    if cost is None:
+        def cost(u, v):
+            weight = graph.get_weight(u, v)
+            return 1 if weight is None else weight
+
+    dist = {source: 0}
+    previous = {source: None}
+    settled = set()
+    tie = count()
+    queue = [(0, next(tie), source)]
+    while queue:
+        d, _, u = heapq.heappop(queue)
+        if u in settled:
+            continue
+        settled.add(u)
+        for v in graph.neighbors(u):
+            if v in settled:
+                continue
+            dv = d + cost(u, v)
+            if v not in dist or dv < dist[v]:
+                dist[v] = dv
+                previous[v] = u
+                heapq.heappush(queue, (dv, next(tie), v))
+
+    paths = {}
+    for target in settled:
+        path = []
+        vertex = target
+        while vertex is not None:
+            path.append(vertex)
+            vertex = previous[vertex]
+        paths[target] = path[::-1]
+    return paths
+
+
+ParetoRoute = namedtuple('ParetoRoute', ['costs', 'path'])
+
+
+def pareto_paths(graph, source, targets, costs):
+    """
+    Find, in one search, all Pareto-optimal paths from source to any of the
+    targets under two cost functions: the paths that no other path beats
+    in both costs at once.
+
+    Returns a list of ParetoRoute(costs, path) sorted by the first cost, so
+    that the first route is the cheapest by costs[0], the last one the
+    cheapest by costs[1], and those in between are the compromises.
+    Like dijkstra(), the graph only needs neighbors(vertex).
+
+    Labels (cost pair, vertex, previous label) are settled in lexicographic
+    order of their costs. A label is then dominated exactly when a label
+    already settled at its vertex, or at a target, has a second cost that
+    is no larger, so only the smallest second cost per vertex is kept.
+    """
+    cost_a, cost_b = costs
+    targets = set(targets)
+    best_b = {}  # vertex -> smallest second cost of a label settled there
+    target_b = math.inf
+    routes = []
+    tie = count()
+    queue = [(0, 0, next(tie), (source, None))]
+    while queue:
+        a, b, _, label = heapq.heappop(queue)
+        u = label[0]
+        if b >= best_b.get(u, math.inf) or b >= target_b:
+            continue
+        best_b[u] = b
+        if u in targets:
+            target_b = b
+            path = []
+            while label is not None:
+                path.append(label[0])
+                label = label[1]
+            routes.append(ParetoRoute((a, b), path[::-1]))
+            continue
+        for v in graph.neighbors(u):
+            bv = b + cost_b(u, v)
+            if bv < best_b.get(v, math.inf) and bv < target_b:
+                heapq.heappush(queue, (a + cost_a(u, v), bv, next(tie), (v, label)))
+    return routes
+
+
+Betweenness = namedtuple('Betweenness', ['vertices', 'edges', 'vertex_errors', 'edge_errors'])
+
+
+def betweenness_centrality(graph, cost=None, processes=None, samples=None, seed=None):
+    """
+    Compute the vertex and edge betweenness centrality of a weighted graph
+    with Brandes' algorithm: for every vertex and edge, the number of
+    shortest paths between other vertices that pass through it.
 
-    # Compute shortest paths using NetworkX
-    paths = nx.shortest_path(graph, source=source, weight='weight')
+    Parameters:
+    - graph: the WeightedGraph to analyse; edges without a weight count as 1.
+    - cost: optional function (a, b) -> cost used instead of the weights.
+    - processes: size of the process pool the source vertices are
+      partitioned across; None uses all CPUs and 1 runs in this process.
+    - samples: if given, only this many randomly chosen source vertices are
+      searched and the result is scaled up to an estimate of the exact value.
+    - seed: random seed for choosing the sampled sources.
+
+    Returns a Betweenness tuple of dictionaries indexed by vertex and by edge.
+    In the sampled mode, vertex_errors and edge_errors give the standard
+    error of each estimate; for exact results they are all 0.
+    """
+    adjacency = {vertex: {} for vertex in graph.nodes}
+    edges = []
+    for a, b in graph.edges:
+        weight = cost(a, b) if cost else graph.get_weight(a, b)
+        weight = 1 if weight is None else weight
+        adjacency[a][b] = adjacency[b][a] = weight
+        edges.append((a, b))
+
+    sources = list(adjacency)
+    n = len(sources)
+    if samples is not None and samples < n:
+        sources = random.Random(seed).sample(sources, samples)
+    k = len(sources)
+
+    processes = processes or os.cpu_count() or 1
+    chunks = [sources[i::processes] for i in range(min(processes, k))]
+    if len(chunks) > 1:
+        with ProcessPoolExecutor(len(chunks)) as pool:
+            partials = list(pool.map(_brandes_sources, [adjacency] * len(chunks), chunks))
+    else:
+        partials = [_brandes_sources(adjacency, sources)]
+
+    sums, squares = {}, {}
+    for partial_sums, partial_squares in partials:
+        for key, value in partial_sums.items():
+            sums[key] = sums.get(key, 0) + value
+            squares[key] = squares.get(key, 0) + partial_squares[key]
+
+    # every unordered pair is counted from both of its ends, hence the 1/2
+    scale = n / k / 2 if k else 0
+    if k < n and k > 1:
+        correction = (n - k) / (n - 1)
+        def error(key):
+            mean = sums.get(key, 0) / k
+            variance = max(squares.get(key, 0) / k - mean * mean, 0) * k / (k - 1)
+            return n / 2 * math.sqrt(variance / k * correction)
+    else:
+        def error(key):
+            return 0.0
+
+    return Betweenness(
+        vertices={v: sums.get(v, 0) * scale for v in adjacency},
+        edges={(a, b): sums.get(frozenset((a, b)), 0) * scale for a, b in edges},
+        vertex_errors={v: error(v) for v in adjacency},
+        edge_errors={(a, b): error(frozenset((a, b))) for a, b in edges},
+    )
+
+
+def _brandes_sources(adjacency, sources):
+    """
+    Sum the dependencies of vertices and edges on shortest paths from each
+    of the sources, together with the sums of their squares.
+    """
+    sums, squares = {}, {}
+    for source in sources:
+        for key, value in _brandes_single_source(adjacency, source).items():
+            sums[key] = sums.get(key, 0) + value
+            squares[key] = squares.get(key, 0) + value * value
+    return sums, squares
 
-    return {target: paths[target] for target in paths}
 
+def _brandes_single_source(adjacency, source):
+    """
+    Return the dependencies of all vertices and edges on the shortest paths
+    from source. Edges are keyed by the frozenset of their endpoints.
+    """
+    # Dijkstra phase: shortest path counts and predecessors, in settling order
+    order = []
+    preds = {source: []}
+    sigma = {source: 1}
+    dist = {}
+    seen = {source: 0}
+    tie = count()
+    queue = [(0, next(tie), source, source)]
+    while queue:
+        d, _, pred, v = heapq.heappop(queue)
+        if v in dist:
+            continue
+        if pred != v:
+            sigma[v] += sigma[pred]
+        order.append(v)
+        dist[v] = d
+        for w, weight in adjacency[v].items():
+            vw = d + weight
+            if w not in dist and (w not in seen or vw < seen[w]):
+                seen[w] = vw
+                heapq.heappush(queue, (vw, next(tie), v, w))
+                sigma[w] = 0
+                preds[w] = [v]
+            elif vw == seen[w]:
+                sigma[w] += sigma[v]
+                preds[w].append(v)
+
+    # accumulation phase, farthest vertices first
+    dependency = {}
+    delta = dict.fromkeys(order, 0)
+    for w in reversed(order):
+        for v in preds[w]:
+            share = sigma[v] / sigma[w] * (1 + delta[w])
+            delta[v] += share
+            edge = frozenset((v, w))
+            dependency[edge] = dependency.get(edge, 0) + share
+        if w != source:
+            dependency[w] = delta[w]
+    return dependency
 
 
 def visualize(graph, view='dot', name='mygraph', nodecolors=None, edgecolors=None, edgelabels=None):
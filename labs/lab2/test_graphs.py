@@ -1,5 +1,39 @@
+import os
+import random
+import tempfile
 import unittest
-from graphs import Graph, WeightedGraph, dijkstra
+import networkx as nx
+from graphs import Graph, WeightedGraph, dijkstra, pareto_paths, betweenness_centrality
+
+class TestViews(unittest.TestCase):
+    def setUp(self):
+        self.graph = WeightedGraph([('A', 'B', 1), ('B', 'C', 2)])
+
+    def test_views_are_live(self):
+        vertices, edges, neighbors = self.graph.vertices(), self.graph.edges(), self.graph.neighbors('B')
+        self.graph.add_edge('B', 'D')
+        self.assertIn('D', vertices)
+        self.assertIn(('D', 'B'), edges)
+        self.assertIn('D', neighbors)
+        self.assertEqual((len(vertices), len(edges), len(neighbors)), (4, 3, 3))
+
+    def test_list_opt_in(self):
+        self.assertEqual(sorted(self.graph.vertices(as_list=True)), ['A', 'B', 'C'])
+        self.assertEqual(sorted(self.graph.neighbors('B', as_list=True)), ['A', 'C'])
+        edges = self.graph.edges(as_list=True)
+        self.assertIsInstance(edges, list)
+        self.assertEqual(len(edges), 2)
+
+    def test_edges_attribute_and_call(self):
+        # iterating graph.edges and calling graph.edges() agree, also after repeated use
+        self.assertEqual(list(self.graph.edges), list(self.graph.edges()))
+        self.assertEqual(list(self.graph.edges()), list(self.graph.edges()))
+        self.assertEqual(sorted(self.graph.edges(data='weight')), [('A', 'B', 1), ('B', 'C', 2)])
+
+    def test_remove_edge(self):
+        self.graph.remove_edge('A', 'B')
+        self.assertNotIn(('A', 'B'), self.graph.edges())
+
 
 class TestWeightedGraph(unittest.TestCase):
     def setUp(self):
@@ -36,11 +70,131 @@ class TestDijkstra(unittest.TestCase):
         paths = dijkstra(self.graph, 'A', cost=lambda u, v: 1)
         self.assertEqual(paths['C'], ['A', 'C'])  # Direct path is shortest with uniform costs
 
+    def test_cost_function_leaves_weights(self):
+        dijkstra(self.graph, 'A', cost=lambda u, v: 1)
+        self.assertEqual(self.graph.get_weight('A', 'C'), 4)
+
+    def test_implicit_graph(self):
+        # a graph that only generates neighbours on demand: i -> i+1, i+3 up to 10
+        class Line:
+            def neighbors(self, vertex):
+                return [v for v in (vertex + 1, vertex + 3) if v <= 10]
+        paths = dijkstra(Line(), 0, cost=lambda u, v: 1 if v - u == 1 else 5)
+        self.assertEqual(len(paths[10]) - 1, 10)
+        paths = dijkstra(Line(), 0, cost=lambda u, v: 1)
+        self.assertEqual(len(paths[10]) - 1, 4)
+
     def test_disconnected_graph(self):
         # Add a disconnected node and ensure no path is found
         self.graph.add_vertex('D')
         paths = dijkstra(self.graph, 'A')
         self.assertNotIn('D', paths)
 
+class TestPareto(unittest.TestCase):
+    def setUp(self):
+        # A to D: fast and long via B, slow and short via C, or the middle way via E
+        self.graph = WeightedGraph([('A', 'B', 1), ('B', 'D', 1), ('A', 'C', 5), ('C', 'D', 5),
+                                    ('A', 'E', 3), ('E', 'D', 3), ('B', 'C', 1)])
+        self.length = {frozenset('AB'): 10, frozenset('BD'): 10, frozenset('AC'): 1, frozenset('CD'): 1,
+                       frozenset('AE'): 4, frozenset('ED'): 4, frozenset('BC'): 1}
+        self.costs = (self.graph.get_weight, lambda u, v: self.length[frozenset((u, v))])
+
+    def test_trade_offs(self):
+        routes = pareto_paths(self.graph, 'A', ['D'], self.costs)
+        # A-B-C-D costs (7, 12) and is beaten by A-E-D in both
+        self.assertEqual(routes, [((2, 20), ['A', 'B', 'D']), ((6, 8), ['A', 'E', 'D']),
+                                  ((10, 2), ['A', 'C', 'D'])])
+
+    def test_extremes_match_dijkstra(self):
+        routes = pareto_paths(self.graph, 'A', ['D'], self.costs)
+        self.assertEqual(routes[0].path, dijkstra(self.graph, 'A')['D'])
+        self.assertEqual(routes[-1].path, dijkstra(self.graph, 'A', cost=self.costs[1])['D'])
+
+    def test_matches_brute_force(self):
+        rng = random.Random(1)
+        graph = WeightedGraph([(u, v, rng.randint(1, 9)) for u, v in nx.gnm_random_graph(9, 20, seed=1).edges])
+        length = {frozenset(edge): rng.randint(1, 9) for edge in graph.edges}
+        costs = (graph.get_weight, lambda u, v: length[frozenset((u, v))])
+        candidates = {(sum(graph.get_weight(a, b) for a, b in zip(p, p[1:])),
+                       sum(length[frozenset((a, b))] for a, b in zip(p, p[1:])))
+                      for p in nx.all_simple_paths(graph, 0, 8)}
+        front = sorted(c for c in candidates
+                       if not any(o != c and o[0] <= c[0] and o[1] <= c[1] for o in candidates))
+        self.assertEqual([route.costs for route in pareto_paths(graph, 0, [8], costs)], front)
+
+    def test_any_target(self):
+        routes = pareto_paths(self.graph, 'A', ['C', 'D'], self.costs)
+        self.assertEqual(routes, [((2, 11), ['A', 'B', 'C']), ((5, 1), ['A', 'C'])])
+        self.assertEqual(pareto_paths(self.graph, 'A', ['A'], self.costs), [((0, 0), ['A'])])
+
+
+class TestBetweenness(unittest.TestCase):
+    def setUp(self):
+        # a square with one diagonal and a tail: A-B-C-D-A, A-C, D-E
+        self.graph = WeightedGraph([('A', 'B', 1), ('B', 'C', 1), ('C', 'D', 1),
+                                    ('D', 'A', 1), ('A', 'C', 3), ('D', 'E', 2)])
+
+    def test_matches_networkx(self):
+        result = betweenness_centrality(self.graph, processes=1)
+        expected = nx.betweenness_centrality(self.graph, normalized=False, weight='weight')
+        for vertex, value in expected.items():
+            self.assertAlmostEqual(result.vertices[vertex], value)
+        expected = nx.edge_betweenness_centrality(self.graph, normalized=False, weight='weight')
+        for (a, b), value in expected.items():
+            self.assertAlmostEqual(result.edges[(a, b)], value)
+        self.assertEqual(set(result.vertex_errors.values()), {0})
+
+    def test_process_pool(self):
+        serial = betweenness_centrality(self.graph, processes=1)
+        parallel = betweenness_centrality(self.graph, processes=2)
+        for vertex, value in serial.vertices.items():
+            self.assertAlmostEqual(parallel.vertices[vertex], value)
+
+    def test_cost_function(self):
+        # with uniform costs the diagonal A-C becomes a shortest path
+        result = betweenness_centrality(self.graph, cost=lambda a, b: 1, processes=1)
+        self.assertGreater(result.edges[('A', 'C')], 0)
+        self.assertEqual(betweenness_centrality(self.graph, processes=1).edges[('A', 'C')], 0)
+
+    def test_sampled_estimate(self):
+        exact = betweenness_centrality(self.graph, processes=1)
+        estimate = betweenness_centrality(self.graph, processes=1, samples=3, seed=2)
+        for vertex, value in exact.vertices.items():
+            # generous bound: the estimate lies within a few standard errors
+            self.assertLessEqual(abs(estimate.vertices[vertex] - value),
+                                 4 * estimate.vertex_errors[vertex] + 1e-9)
+
+
+class TestSaveLoad(unittest.TestCase):
+    def setUp(self):
+        self.graph = WeightedGraph([('A', 'B', 1), ('B', 'C', 2.5), ('Å', 'C', 4)])
+        self.graph.add_edge('C', 'D')  # edge without a weight
+        self.graph.add_vertex('E')  # isolated vertex
+        fd, self.path = tempfile.mkstemp(suffix='.wgraph')
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_round_trip(self):
+        self.graph.save(self.path)
+        loaded = WeightedGraph.load(self.path)
+        self.assertEqual(set(loaded.vertices()), set(self.graph.vertices()))
+        self.assertEqual(loaded.number_of_edges(), self.graph.number_of_edges())
+        for a, b in self.graph.edges():
+            self.assertEqual(loaded.get_weight(a, b), self.graph.get_weight(a, b))
+
+    def test_loaded_graph_routes(self):
+        self.graph.save(self.path)
+        paths = dijkstra(WeightedGraph.load(self.path), 'A')
+        self.assertEqual(paths['C'], ['A', 'B', 'C'])
+
+    def test_not_a_graph_file(self):
+        with open(self.path, 'wb') as file:
+            file.write(b'{"stops": {}}' + bytes(20))
+        with self.assertRaises(ValueError):
+            WeightedGraph.load(self.path)
+
+
 if __name__ == "__main__":
     unittest.main()
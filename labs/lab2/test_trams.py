@@ -1,5 +1,28 @@
+import json
+import os
+import pickle
+import shutil
+import tempfile
 import unittest
-from trams import TramNetwork, build_tram_network
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+from haversine import haversine
+from graphs import dijkstra
+from trams import TramNetwork, TramStop, TramLine, build_tram_network, tram_network_from_dict
+
+
+# networks are built from the JSON in the tests, which leave no cache behind;
+# TestNetworkCache turns it on in a temporary directory
+_no_cache = mock.patch.dict(os.environ, {'TRAM_NO_CACHE': '1'})
+
+
+def setUpModule():
+    _no_cache.start()
+
+
+def tearDownModule():
+    _no_cache.stop()
+
 
 class TestTramNetwork(unittest.TestCase):
     def setUp(self):
@@ -27,6 +50,26 @@ class TestTramNetwork(unittest.TestCase):
         lines = self.network.lines_between_stops("Centralstationen", "Brunnsparken")
         self.assertGreater(len(lines), 0)
 
+    def test_lines_via_all_stops(self):
+        lines = self.network.lines_via_all_stops(["Centralstationen", "Brunnsparken", "Svingeln"])
+        expected = set.intersection(*(set(self.network.lines_via_stop(stop))
+                                      for stop in ["Centralstationen", "Brunnsparken", "Svingeln"]))
+        self.assertEqual(set(lines), expected)
+        self.assertIn("Line 1", lines)
+
+    def test_lines_via_any_stop(self):
+        lines = self.network.lines_via_any_stop(["Östra Sjukhuset", "Angered Centrum"])
+        expected = set(self.network.lines_via_stop("Östra Sjukhuset")) | set(self.network.lines_via_stop("Angered Centrum"))
+        self.assertEqual(set(lines), expected)
+
+    def test_stops_on_any_line(self):
+        stops = self.network.stops_on_any_line(["Line 1", "Line 6"])
+        expected = set(self.network.line_stops("Line 1")) | set(self.network.line_stops("Line 6"))
+        self.assertEqual(set(stops), expected)
+        self.assertEqual(len(stops), len(expected))
+        with self.assertRaises(KeyError):
+            self.network.stops_on_any_line(["Line 99"])
+
     def test_invalid_stop(self):
         # Test for a stop not in the network
         with self.assertRaises(KeyError):
@@ -37,5 +80,410 @@ class TestTramNetwork(unittest.TestCase):
         time = self.network.time_between_stops("Centralstationen", "Brunnsparken")
         self.assertGreater(time, 0)
 
+    def test_ids(self):
+        stop_ids = [stop.id for stop in self.network.stops.values()]
+        line_ids = [line.id for line in self.network.lines.values()]
+        self.assertEqual(stop_ids, list(range(len(stop_ids))))
+        self.assertEqual(line_ids, list(range(len(line_ids))))
+
+
+class TestTramModel(unittest.TestCase):
+    def test_slots(self):
+        stop = TramStop("Chalmers", (57.69, 11.97))
+        with self.assertRaises(AttributeError):
+            stop.colour = "blue"
+        self.assertFalse(hasattr(TramLine("Line 6"), "__dict__"))
+
+    def test_add_without_duplicates(self):
+        stop = TramStop("Chalmers")
+        line = TramLine("Line 6")
+        for _ in range(3):
+            stop.add_line("Line 6")
+            line.add_stop(stop)
+        self.assertEqual(stop.get_lines(), ["Line 6"])
+        self.assertEqual(line.get_stops(), [stop])
+        self.assertTrue(line.has_stop(stop))
+
+    def test_network_assigns_ids(self):
+        network = TramNetwork()
+        for name in ["A", "B", "C"]:
+            network.add_stop(TramStop(name))
+        self.assertEqual(network.stops["C"].id, 2)
+
+
+
+class TestBulkLoader(unittest.TestCase):
+    def build_incrementally(self, data):
+        # the original loader: add_line() with weight 1, then set_transition_time()
+        network = TramNetwork()
+        for stop_name, stop_data in data["stops"].items():
+            network.add_stop(TramStop(stop_name, (stop_data["lat"], stop_data["lon"])))
+        for line_name, stops in data["lines"].items():
+            line = TramLine(f"Line {line_name}")
+            for stop_name in stops:
+                line.add_stop(network.stops[stop_name])
+                network.stops[stop_name].add_line(line.get_name())
+            network.add_line(line)
+        for stop_a, connections in data["times"].items():
+            for stop_b, time in connections.items():
+                network.set_transition_time(stop_a, stop_b, time)
+        return network
+
+    def assertSameNetwork(self, bulk, reference):
+        self.assertEqual(set(bulk.vertices()), set(reference.vertices()))
+        self.assertEqual({frozenset(edge) for edge in bulk.edges()},
+                         {frozenset(edge) for edge in reference.edges()})
+        for a, b in reference.edges():
+            self.assertEqual(bulk.get_weight(a, b), reference.get_weight(a, b))
+        for name, stop in reference.stops.items():
+            self.assertEqual(bulk.stops[name].get_lines(), stop.get_lines())
+        for name, line in reference.lines.items():
+            self.assertEqual(bulk.line_stops(name), reference.line_stops(name))
+
+    def test_matches_incremental_loader(self):
+        with open("tramnetwork.json", encoding="utf-8") as file:
+            data = json.load(file)
+        self.assertSameNetwork(tram_network_from_dict(data), self.build_incrementally(data))
+
+    def test_line_edge_without_time(self):
+        data = {"stops": {s: {"lat": 0, "lon": 0} for s in "ABC"},
+                "lines": {"1": ["A", "B", "C"]},
+                "times": {"B": {"C": 3}, "C": {"B": 3}}}
+        network = tram_network_from_dict(data)
+        self.assertSameNetwork(network, self.build_incrementally(data))
+        self.assertEqual(network.get_weight("A", "B"), 1)
+        self.assertEqual(network.get_weight("C", "B"), 3)
+
+
+class TestNetworkCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.json_file = os.path.join(self.directory, "tramnetwork.json")
+        shutil.copy("tramnetwork.json", self.json_file)
+        self.cache_dir = os.path.join(self.directory, "cache")
+
+    def build(self, **options):
+        return build_tram_network(self.json_file, cache_dir=self.cache_dir, **options)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_cached_network_is_equal(self):
+        built = self.build(use_cache=True)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+        cached = self.build(use_cache=True)
+        self.assertEqual(sorted(cached.edges(data="weight")), sorted(built.edges(data="weight")))
+        self.assertEqual(cached.lines_between_stops("Chalmers", "Korsvägen"),
+                         built.lines_between_stops("Chalmers", "Korsvägen"))
+        self.assertTrue(cached.lines["Line 6"].has_stop(cached.stops["Chalmers"]))
+
+    def test_changed_json_replaces_cache(self):
+        self.build(use_cache=True)
+        with open(self.json_file, encoding="utf-8") as file:
+            data = json.load(file)
+        data["times"]["Chalmers"]["Korsvägen"] = data["times"]["Korsvägen"]["Chalmers"] = 42
+        with open(self.json_file, "w", encoding="utf-8") as file:
+            json.dump(data, file)
+        network = self.build(use_cache=True)
+        self.assertEqual(network.time_between_stops("Chalmers", "Korsvägen"), 42)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+    def test_corrupt_cache_is_rebuilt(self):
+        self.build(use_cache=True)
+        cache_file = os.path.join(self.cache_dir, os.listdir(self.cache_dir)[0])
+        with open(cache_file, "wb") as file:
+            file.write(b"not a pickle")
+        self.assertIn("Chalmers", self.build(use_cache=True).stops)
+
+    def test_cached_network_sees_moved_stop(self):
+        self.build(use_cache=True)
+        cached = self.build(use_cache=True)
+        self.assertGreater(cached.geo_distance("Chalmers", "Korsvägen"), 0)
+        cached.stops["Korsvägen"].set_position(cached.stop_position("Chalmers"))
+        self.assertEqual(cached.geo_distance("Chalmers", "Korsvägen"), 0)
+
+    def test_no_cache(self):
+        self.build(use_cache=False)
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+    def test_truncated_cache_is_rebuilt(self):
+        self.build(use_cache=True)
+        cache_file = os.path.join(self.cache_dir, os.listdir(self.cache_dir)[0])
+        with open(cache_file, "rb") as file:
+            content = file.read()
+        with open(cache_file, "wb") as file:
+            file.write(content[:len(content) // 2])
+        self.assertIn("Chalmers", self.build(use_cache=True).stops)
+        self.assertEqual(os.path.getsize(cache_file), len(content))
+
+    def test_other_loading_errors_are_raised(self):
+        # a valid pickle whose loading raises ValueError, as a bug in __setstate__ would
+        class Unloadable:
+            def __reduce__(self):
+                return int, ("not a number",)
+
+        self.build(use_cache=True)
+        cache_file = os.path.join(self.cache_dir, os.listdir(self.cache_dir)[0])
+        with open(cache_file, "wb") as file:
+            pickle.dump(Unloadable(), file)
+        with self.assertRaises(ValueError):
+            self.build(use_cache=True)
+
+    def test_key_depends_on_code(self):
+        self.build(use_cache=True)
+        first = os.listdir(self.cache_dir)
+        with mock.patch("trams.CODE_DIGEST", b"other code"):
+            self.build(use_cache=True)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+        self.assertNotEqual(os.listdir(self.cache_dir), first)
+
+    def test_json_files_of_same_name(self):
+        other = os.path.join(self.directory, "other")
+        os.mkdir(other)
+        shutil.copy("tramnetwork.json", other)
+        self.build(use_cache=True)
+        build_tram_network(os.path.join(other, "tramnetwork.json"), use_cache=True, cache_dir=self.cache_dir)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+
+
+class TestScenario(unittest.TestCase):
+    def setUp(self):
+        self.network = build_tram_network("tramnetwork.json")
+
+    def route(self, network, dep, dest):
+        return dijkstra(network, dep, cost=network.transition_time).get(dest)
+
+    def test_base_unchanged(self):
+        edges = sorted(self.network.edges(data="weight"))
+        scenario = self.network.scenario()
+        scenario.close_stop("Brunnsparken")
+        scenario.remove_edge("Chalmers", "Korsvägen")
+        scenario.set_transition_time("Valand", "Kungsportsplatsen", 30)
+        self.assertEqual(sorted(self.network.edges(data="weight")), edges)
+        self.assertEqual(len(scenario), len(self.network) - 1)
+
+    def test_closed_stop_is_avoided(self):
+        path = self.route(self.network, "Chalmers", "Centralstationen")
+        scenario = self.network.scenario().close_stop(path[len(path) // 2])
+        detour = self.route(scenario, "Chalmers", "Centralstationen")
+        self.assertNotIn(path[len(path) // 2], detour)
+        self.assertNotIn(path[len(path) // 2], scenario.all_stops())
+        with self.assertRaises(KeyError):
+            scenario.lines_via_stop(path[len(path) // 2])
+
+    def test_removed_and_slowed_edges(self):
+        scenario = self.network.scenario().remove_edge("Chalmers", "Korsvägen")
+        self.assertFalse(scenario.has_edge("Korsvägen", "Chalmers"))
+        self.assertNotIn("Korsvägen", scenario.neighbors("Chalmers"))
+        slow = self.network.scenario().slow_down("Chalmers", "Korsvägen", 10)
+        self.assertEqual(slow.time_between_stops("Korsvägen", "Chalmers"),
+                         10 * self.network.time_between_stops("Chalmers", "Korsvägen"))
+
+    def test_parallel_scenarios(self):
+        stops = ["Korsvägen", "Valand", "Brunnsparken", "Järntorget", "Vasaplatsen"]
+        scenarios = [self.network.scenario().close_stop(stop) for stop in stops]
+        serial = [self.route(s, "Chalmers", "Hjalmar Brantingsplatsen") for s in scenarios]
+        with ThreadPoolExecutor(4) as pool:
+            parallel = list(pool.map(lambda s: self.route(s, "Chalmers", "Hjalmar Brantingsplatsen"), scenarios))
+        self.assertEqual(parallel, serial)
+
+
+
+class TestFrozenNetwork(unittest.TestCase):
+    def setUp(self):
+        self.network = build_tram_network("tramnetwork.json")
+        self.frozen = self.network.freeze()
+
+    def test_modification_raises(self):
+        with self.assertRaises(TypeError):
+            self.frozen.set_transition_time("Chalmers", "Korsvägen", 1)
+        with self.assertRaises(TypeError):
+            self.frozen.add_stop(TramStop("Nowhere"))
+        with self.assertRaises(TypeError):
+            self.frozen.stops["Nowhere"] = TramStop("Nowhere")
+        self.assertIs(self.frozen.freeze(), self.frozen)
+
+    def test_independent_of_base(self):
+        position = self.frozen.stop_position("Chalmers")
+        self.network.stops["Chalmers"].set_position((0, 0))
+        self.network.stops["Chalmers"].add_line("Line 99")
+        self.assertEqual(self.frozen.stop_position("Chalmers"), position)
+        self.assertNotIn("Line 99", self.frozen.lines_via_stop("Chalmers"))
+        # the copied lines hold the copied stops
+        line = self.frozen.lines["Line 7"]
+        self.assertIs(line.get_stops()[0], self.frozen.stops[line.get_stops()[0].get_name()])
+        # the adjacency arrays do not hide the weights of WeightedGraph
+        self.assertIsInstance(self.frozen.weights, dict)
+
+    def test_same_answers(self):
+        self.assertEqual(self.frozen.lines_between_stops("Chalmers", "Korsvägen"),
+                         self.network.lines_between_stops("Chalmers", "Korsvägen"))
+        self.assertEqual(self.frozen.time_between_stops("Chalmers", "Korsvägen"),
+                         self.network.time_between_stops("Chalmers", "Korsvägen"))
+        paths = dijkstra(self.network, "Chalmers")
+        path, minutes = self.frozen.shortest_path("Chalmers", "Angered Centrum")
+        self.assertEqual(path, paths["Angered Centrum"])
+        self.assertEqual(minutes, sum(self.network.get_weight(a, b) for a, b in zip(path, path[1:])))
+
+    def test_concurrent_queries(self):
+        # many threads routing on one shared frozen network get the serial answers
+        stops = self.frozen.list_all_stops()
+        pairs = [(a, b) for a in stops[::7] for b in stops[::5]]
+
+        def answer(pair):
+            dep, dest = pair
+            return (self.frozen.shortest_path(dep, dest),
+                    dijkstra(self.frozen, dep, cost=self.frozen.transition_time).get(dest),
+                    self.frozen.lines_between_stops(dep, dest))
+
+        serial = [answer(pair) for pair in pairs]
+        with ThreadPoolExecutor(8) as pool:
+            for _ in range(3):
+                self.assertEqual(list(pool.map(answer, pairs)), serial)
+
+
+class TestLineStatistics(unittest.TestCase):
+    def setUp(self):
+        data = {"stops": {"A": {"lat": 57.70, "lon": 11.90}, "B": {"lat": 57.71, "lon": 11.90},
+                          "C": {"lat": 57.72, "lon": 11.90}, "D": {"lat": 57.80, "lon": 11.90}},
+                "lines": {"1": ["A", "B", "C", "D"]},
+                "times": {"A": {"B": 2}, "B": {"A": 2, "C": 2}, "C": {"B": 2, "D": 2}, "D": {"C": 2}}}
+        self.data = data
+        self.network = tram_network_from_dict(data)
+
+    def test_along_track(self):
+        stats = self.network.line_statistics()["Line 1"]
+        self.assertEqual(stats.stretch, ("A", "D"))
+        self.assertEqual(stats.stops, 4)
+        self.assertAlmostEqual(stats.length, self.network.geo_distance("A", "D"), places=6)
+        self.assertEqual(stats.cumulative_times, [0, 2, 4, 6])
+        self.assertAlmostEqual(stats.average_speed, stats.length / 6 * 60)
+
+    def test_outliers(self):
+        # C-D is eight times as long as the other segments in the same time
+        stats = self.network.line_statistics()["Line 1"]
+        self.assertEqual([(a, b) for a, b, _ in stats.outliers], [("C", "D")])
+
+    def test_cache_invalidation(self):
+        first = self.network.line_statistics()
+        self.assertIs(self.network.line_statistics(), first)
+        self.network.set_transition_time("C", "D", 16)
+        stats = self.network.line_statistics()["Line 1"]
+        self.assertEqual(stats.travel_time, 20)
+        self.assertEqual(stats.outliers, [])
+
+    def test_invalidated_by_graph_changes(self):
+        first = self.network.line_statistics()
+        self.network.set_weight("A", "B", 102)
+        self.assertEqual(self.network.line_statistics()["Line 1"].travel_time, 106)
+        self.assertIsNot(self.network.line_statistics(), first)
+
+    def test_invalidated_by_moved_stop(self):
+        length = self.network.line_statistics()["Line 1"].length
+        self.network.stops["D"].set_position((57.73, 11.90))
+        self.assertLess(self.network.line_statistics()["Line 1"].length, length)
+        self.assertAlmostEqual(self.network.geo_distance("C", "D"),
+                               haversine((57.72, 11.90), (57.73, 11.90)))
+
+    def test_other_network_not_invalidated(self):
+        first = self.network.line_statistics()
+        other = tram_network_from_dict(self.data)
+        other.stops["D"].set_position((57.73, 11.90))
+        self.assertIs(self.network.line_statistics(), first)
+
+    def test_frozen_not_written(self):
+        frozen = self.network.freeze()
+        self.assertEqual(frozen.line_statistics(), self.network.line_statistics())
+        self.assertIsNone(frozen._line_statistics)
+        # moving a stop of the base does not affect the frozen copy
+        self.network.stops["D"].set_position((57.73, 11.90))
+        self.assertEqual(frozen.line_statistics()["Line 1"].outliers[0][:2], ("C", "D"))
+
+    def test_table_rows(self):
+        header, rows = self.network.line_statistics_table()
+        self.assertEqual(len(header), len(rows[0]))
+        self.assertEqual(rows[0][:2], ["Line 1", "A - D"])
+
+
+class TestGeometry(unittest.TestCase):
+    def setUp(self):
+        self.network = build_tram_network("tramnetwork.json")
+
+    def test_bounding_box(self):
+        positions = [self.network.stop_position(stop) for stop in self.network.all_stops()]
+        self.assertEqual(self.network.extreme_positions(),
+                         (min(p[0] for p in positions), min(p[1] for p in positions),
+                          max(p[0] for p in positions), max(p[1] for p in positions)))
+
+    def test_edge_lengths(self):
+        for a, b, data in self.network.edges(data=True):
+            self.assertAlmostEqual(data['length'], haversine(self.network.stop_position(a),
+                                                             self.network.stop_position(b)))
+            self.assertEqual(self.network.geo_distance(a, b), data['length'])
+
+    def test_projection(self):
+        # planar distances between neighbours stay within a percent of the geodesic ones
+        for a, b, data in self.network.edges(data=True):
+            (xa, ya), (xb, yb) = self.network.projected_position(a), self.network.projected_position(b)
+            self.assertAlmostEqual(((xa - xb) ** 2 + (ya - yb) ** 2) ** 0.5, data['length'],
+                                   delta=data['length'] / 100 + 1e-9)
+        width, height = self.network.projected_size()
+        self.assertTrue(0 < width < 50 and 0 < height < 50)
+
+    def test_updated_after_change(self):
+        self.network.add_stop(TramStop("Far North", position=(58.5, 11.9)))
+        self.network.set_transition_time("Far North", "Angered Centrum", 60)
+        self.assertEqual(self.network.extreme_positions()[2], 58.5)
+        self.assertAlmostEqual(self.network.geo_distance("Far North", "Angered Centrum"),
+                               haversine((58.5, 11.9), self.network.stop_position("Angered Centrum")))
+
+    def test_frozen_length_layer(self):
+        frozen = self.network.freeze()
+        path, km = frozen.shortest_path("Chalmers", "Angered Centrum", layer='length')
+        self.assertEqual(path, dijkstra(self.network, "Chalmers", cost=self.network.geo_distance)["Angered Centrum"])
+        self.assertAlmostEqual(km, sum(self.network.geo_distance(a, b) for a, b in zip(path, path[1:])))
+
+
+class TestEdgeLines(unittest.TestCase):
+    def setUp(self):
+        data = {"stops": {s: {"lat": 57.7, "lon": 11.9 + i / 100} for i, s in enumerate("ABCDEX")},
+                "lines": {"1": ["A", "B", "C", "D"], "2": ["B", "C", "E"], "3": ["X", "C", "D"]},
+                "times": {"X": {"E": 5}, "E": {"X": 5}}}
+        self.network = tram_network_from_dict(data)
+
+    def test_lines_on_edge(self):
+        self.assertEqual(self.network.lines_on_edge("C", "B"), ["Line 1", "Line 2"])
+        self.assertEqual(self.network.lines_on_edge("C", "D"), ["Line 1", "Line 3"])
+        self.assertEqual(self.network.lines_on_edge("X", "E"), [])
+        # B and D share line 1 but are not neighbours
+        self.assertEqual(self.network.lines_on_edge("B", "D"), [])
+
+    def test_edge_line_mask(self):
+        mask = self.network.edge_line_mask("C", "D")
+        self.assertEqual(mask, self.network.line_bit("Line 1") | self.network.line_bit("Line 3"))
+        self.assertEqual(self.network.edge_line_mask("B", "D"), 0)
+        scenario = self.network.scenario().remove_edge("C", "D")
+        self.assertEqual(scenario.edge_line_mask("C", "D"), 0)
+        self.assertEqual(scenario.edge_line_mask("B", "C"), self.network.edge_line_mask("B", "C"))
+
+    def test_path_legs(self):
+        self.assertEqual(self.network.path_legs(["A", "B", "C", "D"]), [("Line 1", "A", "D")])
+        self.assertEqual(self.network.path_legs(["A", "B", "C", "E"]),
+                         [("Line 1", "A", "C"), ("Line 2", "C", "E")])
+        self.assertEqual(self.network.path_legs(["D", "C", "X", "E"]),
+                         [("Line 3", "D", "X"), (None, "X", "E")])
+        self.assertEqual(self.network.path_legs(["A"]), [])
+
+    def test_fewest_changes(self):
+        network = build_tram_network("tramnetwork.json")
+        path = dijkstra(network, "Chalmers")["Angered Centrum"]
+        legs = network.path_legs(path)
+        # no line runs the whole way, and line 7 goes furthest from Chalmers
+        self.assertEqual(legs, [("Line 7", "Chalmers", "Gamlestads Torg"),
+                                ("Line 4", "Gamlestads Torg", "Angered Centrum")])
+        frozen = network.freeze()
+        self.assertEqual(frozen.path_legs(path), legs)
+
+
 if __name__ == "__main__":
     unittest.main()
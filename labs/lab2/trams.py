@@ -1,12 +1,49 @@
 from graphs import WeightedGraph
+import networkx as nx
+import copy
+import hashlib
+import heapq
 import json
+import math
+import os
+import pickle
+import sys
+import tempfile
+from array import array
+from collections import namedtuple
+from itertools import count
+from types import MappingProxyType
 from graphviz import Digraph
+from haversine import haversine
+
+# part of the cache key: change it whenever the pickled classes change
+__version__ = '2.6'
+
+# where built networks are cached, private to the user
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'trams')
+
+EARTH_RADIUS = 6371.0088  # mean radius in km, the one haversine uses
+
 
 class TramStop:
-    def __init__(self, name, position=None, lines=None):
+    __slots__ = ('name', 'position', 'lines', 'id', 'line_mask', '_line_set', '_networks')
+
+    def __init__(self, name, position=None, lines=None, id=None):
         self.name = name
         self.position = position if position else (0, 0)
-        self.lines = lines if lines else []
+        self.lines = list(lines) if lines else []
+        self._line_set = set(self.lines)
+        self.id = id  # assigned by TramNetwork.add_stop if not given
+        self.line_mask = 0  # bit line.id is set for each line added via this stop
+        self._networks = []  # the TramNetworks it was added to, whose caches a move invalidates
+
+    def __getstate__(self):
+        return self.name, self.position, self.lines, self.id, self.line_mask
+
+    def __setstate__(self, state):
+        self.name, self.position, self.lines, self.id, self.line_mask = state
+        self._line_set = set(self.lines)
+        self._networks = []  # registered again by the network that is unpickled with it
 
     def get_name(self):
         return self.name
@@ -16,19 +53,34 @@ class TramStop:
 
     def set_position(self, position):
         self.position = position
+        for network in self._networks:
+            network._version += 1
 
     def get_lines(self):
         return self.lines
 
     def add_line(self, line):
-        if line not in self.lines:
+        if line not in self._line_set:
+            self._line_set.add(line)
             self.lines.append(line)
 
 
 class TramLine:
-    def __init__(self, name, stops=None):
+    __slots__ = ('name', 'stops', 'id', 'stop_mask', '_stop_set')
+
+    def __init__(self, name, stops=None, id=None):
         self.name = name
-        self.stops = stops if stops else []
+        self.stops = list(stops) if stops else []
+        self._stop_set = set(self.stops)
+        self.id = id  # assigned by TramNetwork.add_line if not given
+        self.stop_mask = 0  # bit stop.id is set for each of its stops
+
+    def __getstate__(self):
+        return self.name, self.stops, self.id, self.stop_mask
+
+    def __setstate__(self, state):
+        self.name, self.stops, self.id, self.stop_mask = state
+        self._stop_set = set(self.stops)
 
     def get_name(self):
         return self.name
@@ -36,8 +88,12 @@ class TramLine:
     def get_stops(self):
         return self.stops
 
+    def has_stop(self, stop):
+        return stop in self._stop_set
+
     def add_stop(self, stop):
-        if stop not in self.stops:
+        if stop not in self._stop_set:
+            self._stop_set.add(stop)
             self.stops.append(stop)
 
 
@@ -46,22 +102,102 @@ class TramNetwork(WeightedGraph):
         super().__init__()
         self.stops = {}
         self.lines = {}
+        self._stop_names = {}  # id -> name, to decode bitmasks
+        self._line_names = {}
+        self._edge_lines = {}  # frozenset of two stop names -> bitmask of the lines running between them
+        self._version = 0  # increased by every change, to invalidate cached results
+        self._line_statistics = None
+        self._geometry_version = None
+        self._bbox = None
+        self._x, self._y = array('d'), array('d')
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        for stop in self.stops.values():
+            stop._networks.append(self)
+
+    def _state(self):
+        """
+        What cached results depend on: _version, increased by the methods of
+        the network that change it and by set_position() on its stops.
+        Changes made by calling other networkx methods on the graph directly
+        are not counted, and leave the cached results as they were.
+        """
+        return self._version
+
+    def add_vertex(self, vertex):
+        self._version += 1
+        super().add_vertex(vertex)
+
+    def remove_vertex(self, vertex):
+        self._version += 1
+        super().remove_vertex(vertex)
+
+    def add_edge(self, vertex1, vertex2):
+        self._version += 1
+        super().add_edge(vertex1, vertex2)
+
+    def remove_edge(self, vertex1, vertex2):
+        self._version += 1
+        super().remove_edge(vertex1, vertex2)
+
+    def set_weight(self, vertex1, vertex2, weight):
+        self._version += 1
+        super().set_weight(vertex1, vertex2, weight)
 
     def add_stop(self, stop):
+        if stop.id is None:
+            stop.id = len(self.stops)
+        self._version += 1
         self.stops[stop.get_name()] = stop
+        if self not in stop._networks:
+            stop._networks.append(self)
+        self._stop_names[stop.id] = stop.get_name()
         self.add_vertex(stop.get_name())
 
-    def add_line(self, line):
+    def add_line(self, line, add_edges=True):
+        """
+        Add a line, and unless add_edges is False, an edge of weight 1
+        between each pair of its consecutive stops.
+        The line's stops must already be in the network; they are recorded
+        in the line and stop bitmasks, and the line in the bitmask of each
+        segment it runs on.
+        """
+        if line.id is None:
+            line.id = len(self.lines)
+        self._version += 1
         self.lines[line.get_name()] = line
+        self._line_names[line.id] = line.get_name()
+        for stop in line.get_stops():
+            stop.line_mask |= 1 << line.id
+            line.stop_mask |= 1 << stop.id
         stops = line.get_stops()
+        for stop_a, stop_b in zip(stops, stops[1:]):
+            edge = frozenset((stop_a.get_name(), stop_b.get_name()))
+            self._edge_lines[edge] = self._edge_lines.get(edge, 0) | 1 << line.id
+        if not add_edges:
+            return
         for i in range(len(stops) - 1):
             self.add_edge(stops[i].get_name(), stops[i + 1].get_name())
             self.set_weight(stops[i].get_name(), stops[i + 1].get_name(), 1)
 
     def set_transition_time(self, stop_a, stop_b, time):
+        self._version += 1
         self.add_edge(stop_a, stop_b)
         self.set_weight(stop_a, stop_b, time)
 
+    def all_stops(self):
+        """
+        Live view of the stop names; use list_all_stops() for a list copy.
+        """
+        return self.stops.keys()
+
+    def all_lines(self):
+        """
+        Live view of the line names; use list_all_lines() for a list copy.
+        """
+        return self.lines.keys()
+
     def list_all_stops(self):
         return list(self.stops.keys())
 
@@ -77,44 +213,556 @@ class TramNetwork(WeightedGraph):
     def lines_between_stops(self, stop_a, stop_b):
         if stop_a not in self.stops or stop_b not in self.stops:
             raise KeyError(f"One or both stops {stop_a}, {stop_b} do not exist in the network.")
-        lines_a = set(self.stops[stop_a].get_lines())
-        lines_b = set(self.stops[stop_b].get_lines())
-        return list(lines_a & lines_b)
+        return self.lines_via_all_stops([stop_a, stop_b])
+
+    def lines_via_all_stops(self, stop_names):
+        """
+        Lines that serve every one of the given stops.
+        """
+        mask = -1
+        for name in stop_names:
+            mask &= self._stop(name).line_mask
+        return _decode(mask, self._line_names) if mask != -1 else []
+
+    def lines_via_any_stop(self, stop_names):
+        """
+        Lines that serve at least one of the given stops.
+        """
+        mask = 0
+        for name in stop_names:
+            mask |= self._stop(name).line_mask
+        return _decode(mask, self._line_names)
+
+    def stops_on_any_line(self, line_names):
+        """
+        Stops served by at least one of the given lines.
+        """
+        mask = 0
+        for name in line_names:
+            if name not in self.lines:
+                raise KeyError(f"Line {name} does not exist in the network.")
+            mask |= self.lines[name].stop_mask
+        return _decode(mask, self._stop_names)
+
+    def line_bit(self, line_name):
+        """
+        The bit of a line in the masks of edge_line_mask().
+        """
+        return 1 << self.lines[line_name].id
+
+    def edge_line_mask(self, stop_a, stop_b):
+        """
+        Bitmask of the lines that run directly between two neighbouring
+        stops, with bit line.id set for each of them; 0 for other pairs.
+        """
+        return self._edge_lines.get(frozenset((stop_a, stop_b)), 0)
+
+    def lines_on_edge(self, stop_a, stop_b):
+        """
+        Lines that run directly between two neighbouring stops, in id order.
+        """
+        return _decode(self.edge_line_mask(stop_a, stop_b), self._line_names)
+
+    def path_legs(self, path):
+        """
+        Split a path of stops, such as one found by dijkstra, into as few
+        legs (line, first stop, last stop) as possible; the last stop of
+        each leg is where to change to the next one.
+        Each leg rides as far as some line goes along the path, which gives
+        the fewest changes. A segment without any line is a leg of line None.
+        """
+        legs = []
+        i = 0
+        while i < len(path) - 1:
+            mask = self.edge_line_mask(path[i], path[i + 1])
+            j = i + 1
+            while mask and j < len(path) - 1:
+                next_mask = mask & self.edge_line_mask(path[j], path[j + 1])
+                if not next_mask:
+                    break
+                mask, j = next_mask, j + 1
+            line = self._line_names[(mask & -mask).bit_length() - 1] if mask else None
+            legs.append((line, path[i], path[j]))
+            i = j
+        return legs
+
+    def _stop(self, stop_name):
+        if stop_name not in self.stops:
+            raise KeyError(f"Stop {stop_name} does not exist in the network.")
+        return self.stops[stop_name]
+
+    def stop_position(self, stop_name):
+        return self.stops[stop_name].get_position()
+
+    def line_stops(self, line_name):
+        return [stop.get_name() for stop in self.lines[line_name].get_stops()]
+
+    def transition_time(self, stop_a, stop_b):
+        return self.get_weight(stop_a, stop_b)
+
+    def geo_distance(self, stop_a, stop_b):
+        """
+        Distance in kilometres between two stops, as the crow flies.
+        Neighbouring stops read the precomputed 'length' of their edge.
+        """
+        data = self._adj.get(stop_a, {}).get(stop_b)
+        if data is not None and 'length' in data and self._geometry_version == self._state():
+            return data['length']
+        return haversine(self.stop_position(stop_a), self.stop_position(stop_b))
+
+    def compute_geometry(self):
+        """
+        Precompute the bounding box of the stops, their planar positions in
+        kilometres east and north of its south-west corner, indexed by stop
+        id, and the length in kilometres of every edge, stored as its
+        'length' attribute.
+        Done when the network is built, and again after any change.
+        """
+        if self.stops:
+            positions = [stop.get_position() for stop in self.stops.values()]
+            lats = [lat for lat, _ in positions]
+            lons = [lon for _, lon in positions]
+            self._bbox = minlat, minlon, maxlat, maxlon = min(lats), min(lons), max(lats), max(lons)
+        else:
+            self._bbox = minlat, minlon, maxlat, maxlon = 0, 0, 0, 0
+
+        # equirectangular projection around the middle latitude, exact enough for a city
+        km_per_lat = EARTH_RADIUS * math.pi / 180
+        km_per_lon = km_per_lat * math.cos(math.radians((minlat + maxlat) / 2))
+        size = max((stop.id for stop in self.stops.values()), default=-1) + 1
+        self._x, self._y = array('d', bytes(8 * size)), array('d', bytes(8 * size))
+        for stop in self.stops.values():
+            lat, lon = stop.get_position()
+            self._x[stop.id] = (lon - minlon) * km_per_lon
+            self._y[stop.id] = (lat - minlat) * km_per_lat
+
+        for stop_a, stop_b, data in self.edges(data=True):
+            if stop_a in self.stops and stop_b in self.stops:
+                data['length'] = haversine(self.stops[stop_a].get_position(), self.stops[stop_b].get_position())
+        self._geometry_version = self._state()
+
+    def _geometry(self):
+        if self._geometry_version != self._state():
+            self.compute_geometry()
+
+    def extreme_positions(self):
+        """
+        Return the bounding box of all stops as minlat, minlon, maxlat, maxlon.
+        """
+        self._geometry()
+        return self._bbox
+
+    def projected_position(self, stop_name):
+        """
+        Planar position (x, y) of a stop in kilometres east and north of
+        the south-west corner of the bounding box.
+        """
+        self._geometry()
+        i = self._stop(stop_name).id
+        return self._x[i], self._y[i]
+
+    def projected_size(self):
+        """
+        Width and height in kilometres of the bounding box of all stops.
+        """
+        self._geometry()
+        return max(self._x, default=0), max(self._y, default=0)
+
+    def time_between_stops(self, stop_a, stop_b):
+        if not self.has_edge(stop_a, stop_b):
+            raise ValueError(f"No direct connection exists between {stop_a} and {stop_b}.")
+        return self.get_weight(stop_a, stop_b)
+
+    def line_statistics(self, outlier_factor=2.0):
+        """
+        Travel statistics of every line, {line name: LineStatistics}, in one
+        pass over the stops of all lines. Lengths are measured along the
+        track in km, times are in minutes and speeds in km/h. A segment is
+        an outlier if its speed differs from the median speed of its line by
+        more than outlier_factor times, or if it takes no time at all.
+        The result is cached until the network is changed.
+        """
+        key = (self._state(), outlier_factor)
+        if self._line_statistics is not None and self._line_statistics[0] == key:
+            return self._line_statistics[1]
+        statistics = self._compute_line_statistics(outlier_factor)
+        self._line_statistics = (key, statistics)
+        return statistics
+
+    def _compute_line_statistics(self, outlier_factor):
+        statistics = {}
+        for name, line in self.lines.items():
+            stops = [stop.get_name() for stop in line.get_stops()]
+            lengths, times, speeds = [], [], []
+            cumulative_times = [0]
+            for a, b in zip(stops, stops[1:]):
+                length = self.geo_distance(a, b)
+                time = self.get_weight(a, b) or 0
+                lengths.append(length)
+                times.append(time)
+                cumulative_times.append(cumulative_times[-1] + time)
+                speeds.append(length / time * 60 if time else None)
+            known = sorted(speed for speed in speeds if speed is not None)
+            median = known[len(known) // 2] if known else None
+            outliers = [(a, b, speed) for a, b, speed in zip(stops, stops[1:], speeds)
+                        if speed is None or not median / outlier_factor <= speed <= median * outlier_factor]
+            length, travel_time = sum(lengths), cumulative_times[-1]
+            statistics[name] = LineStatistics(
+                line=name, stretch=(stops[0], stops[-1]) if stops else (None, None), stops=len(stops),
+                length=length, cumulative_times=cumulative_times, travel_time=travel_time,
+                average_speed=length / travel_time * 60 if travel_time else None,
+                segment_speeds=speeds, outliers=outliers)
+        return statistics
+
+    def line_statistics_table(self):
+        """
+        The line statistics as a header and rows of strings, as taken by htmlgen.table().
+        """
+        rows = []
+        for stats in self.line_statistics().values():
+            speed = f"{stats.average_speed:.2f}" if stats.average_speed is not None else "-"
+            rows.append([stats.line, " - ".join(map(str, stats.stretch)), f"{stats.length:.2f}",
+                         str(stats.stops), str(stats.travel_time), speed])
+        return LINE_STATISTICS_HEADER, rows
+
+    def scenario(self):
+        """
+        Start a what-if Scenario on top of this network.
+        """
+        return Scenario(self)
+
+    def freeze(self):
+        """
+        Return a read-only FrozenTramNetwork copy of this network.
+        """
+        return FrozenTramNetwork(self)
+
+
+class FrozenTramNetwork(TramNetwork):
+    """
+    An immutable snapshot of a TramNetwork that can be shared by many
+    threads. Every method that would change it raises TypeError, and the
+    adjacency and weights are precomputed into arrays indexed by stop
+    number that shortest_path() searches without touching the graph.
+    """
+    def __init__(self, network):
+        super().__init__()
+        self.add_nodes_from(network.nodes(data=True))
+        self.add_edges_from(network.edges(data=True))
+        # own copies of the stops and lines, which still refer to each other
+        stops, lines = copy.deepcopy((dict(network.stops), dict(network.lines)))
+        self.stops = MappingProxyType(stops)
+        self.lines = MappingProxyType(lines)
+        self._stop_names = MappingProxyType(dict(network._stop_names))
+        self._line_names = MappingProxyType(dict(network._line_names))
+        self._edge_lines = MappingProxyType(dict(network._edge_lines))
+
+        # compressed adjacency: the neighbours of stop i are adj_targets[adj_offsets[i]:adj_offsets[i+1]]
+        self.names = tuple(self.nodes)
+        self.index = MappingProxyType({name: i for i, name in enumerate(self.names)})
+        self.compute_geometry()
+        self.adj_offsets, self.adj_targets = array('i', [0]), array('i')
+        self.adj_weights, self.adj_lengths = array('d'), array('d')
+        for name in self.names:
+            for neighbor, data in self._adj[name].items():
+                self.adj_targets.append(self.index[neighbor])
+                weight = data.get('weight')
+                self.adj_weights.append(1 if weight is None else weight)
+                self.adj_lengths.append(data.get('length', 0))
+            self.adj_offsets.append(len(self.adj_targets))
+        self._neighbors = MappingProxyType({name: tuple(self._adj[name]) for name in self.names})
+        nx.freeze(self)
+
+    def _frozen(self, *args, **kwargs):
+        raise TypeError("A frozen TramNetwork cannot be modified.")
+
+    def _state(self):
+        return 'frozen'  # its own stops are never moved, whatever happens to other stops
+
+    def line_statistics(self, outlier_factor=2.0):
+        """
+        As for TramNetwork, but computed on every call: reading a frozen
+        network never writes to it.
+        """
+        return self._compute_line_statistics(outlier_factor)
+
+    add_stop = add_line = set_transition_time = _frozen
+    add_vertex = add_edge = remove_vertex = remove_edge = set_weight = set_vertex_value = _frozen
+
+    def neighbors(self, vertex, as_list=False):
+        return list(self._neighbors[vertex]) if as_list else self._neighbors[vertex]
+
+    def shortest_path(self, dep, dest, layer='weight'):
+        """
+        The path with the smallest total weight from dep to dest and its
+        weight, or (None, None) if dest cannot be reached.
+        With layer='length' the geographic length in km is minimised instead.
+        """
+        offsets, targets = self.adj_offsets, self.adj_targets
+        weights = self.adj_lengths if layer == 'length' else self.adj_weights
+        source, goal = self.index[dep], self.index[dest]
+        dist = {source: 0}
+        previous = {source: -1}
+        tie = count()
+        queue = [(0, next(tie), source)]
+        while queue:
+            d, _, u = heapq.heappop(queue)
+            if u == goal:
+                path = []
+                while u != -1:
+                    path.append(self.names[u])
+                    u = previous[u]
+                return path[::-1], d
+            if d > dist[u]:
+                continue
+            for k in range(offsets[u], offsets[u + 1]):
+                v, dv = targets[k], d + weights[k]
+                if v not in dist or dv < dist[v]:
+                    dist[v] = dv
+                    previous[v] = u
+                    heapq.heappush(queue, (dv, next(tie), v))
+        return None, None
+
+    def freeze(self):
+        return self
+
+
+LineStatistics = namedtuple('LineStatistics', [
+    'line', 'stretch', 'stops', 'length', 'cumulative_times', 'travel_time',
+    'average_speed', 'segment_speeds', 'outliers'])
+
+LINE_STATISTICS_HEADER = ["Line", "Stretch", "Length", "Stops", "Travel time", "Average speed"]
+
+
+class Scenario:
+    """
+    A disruption scenario over a base TramNetwork: closed stops, removed
+    segments and changed transition times are recorded here, and all
+    queries and routing read through them to the base network, which is
+    never modified. Creating a scenario therefore costs only its changes,
+    and any number of scenarios can share the base, for instance in
+    parallel threads. The base must not be changed while scenarios use it.
+    """
+    def __init__(self, base):
+        self.base = base
+        self.closed_stops = set()
+        self.removed_edges = set()
+        self.weights = {}
+
+    def close_stop(self, stop_name):
+        self.base._stop(stop_name)
+        self.closed_stops.add(stop_name)
+        return self
+
+    def remove_edge(self, stop_a, stop_b):
+        if not self.has_edge(stop_a, stop_b):
+            raise ValueError(f"No direct connection exists between {stop_a} and {stop_b}.")
+        self.removed_edges.add(frozenset((stop_a, stop_b)))
+        return self
+
+    def set_transition_time(self, stop_a, stop_b, time):
+        if not self.has_edge(stop_a, stop_b):
+            raise ValueError(f"No direct connection exists between {stop_a} and {stop_b}.")
+        self.weights[frozenset((stop_a, stop_b))] = time
+        return self
+
+    def slow_down(self, stop_a, stop_b, factor):
+        return self.set_transition_time(stop_a, stop_b, self.get_weight(stop_a, stop_b) * factor)
+
+    def __len__(self):
+        return len(self.base) - len(self.closed_stops)
+
+    def __contains__(self, stop_name):
+        return stop_name in self.base.stops and stop_name not in self.closed_stops
+
+    def all_stops(self):
+        return [stop for stop in self.base.all_stops() if stop not in self.closed_stops]
+
+    vertices = all_stops
+
+    def has_edge(self, stop_a, stop_b):
+        return (stop_a in self and stop_b in self and self.base.has_edge(stop_a, stop_b)
+                and frozenset((stop_a, stop_b)) not in self.removed_edges)
+
+    def neighbors(self, stop_name):
+        if stop_name not in self:
+            raise KeyError(f"Stop {stop_name} is closed or does not exist in the network.")
+        return [stop for stop in self.base.neighbors(stop_name) if self.has_edge(stop_name, stop)]
+
+    def get_weight(self, stop_a, stop_b):
+        if not self.has_edge(stop_a, stop_b):
+            return None
+        return self.weights.get(frozenset((stop_a, stop_b)), self.base.get_weight(stop_a, stop_b))
+
+    transition_time = get_weight
 
     def time_between_stops(self, stop_a, stop_b):
         if not self.has_edge(stop_a, stop_b):
             raise ValueError(f"No direct connection exists between {stop_a} and {stop_b}.")
         return self.get_weight(stop_a, stop_b)
 
+    def geo_distance(self, stop_a, stop_b):
+        return self.base.geo_distance(stop_a, stop_b)
+
+    def stop_position(self, stop_name):
+        return self.base.stop_position(stop_name)
+
+    def lines_via_stop(self, stop_name):
+        if stop_name in self.closed_stops:
+            raise KeyError(f"Stop {stop_name} is closed.")
+        return self.base.lines_via_stop(stop_name)
+
+    def lines_between_stops(self, stop_a, stop_b):
+        if stop_a in self.closed_stops or stop_b in self.closed_stops:
+            raise KeyError(f"One or both stops {stop_a}, {stop_b} are closed.")
+        return self.base.lines_between_stops(stop_a, stop_b)
+
+    def line_bit(self, line_name):
+        return self.base.line_bit(line_name)
+
+    def edge_line_mask(self, stop_a, stop_b):
+        return self.base.edge_line_mask(stop_a, stop_b) if self.has_edge(stop_a, stop_b) else 0
 
-def build_tram_network(json_file="tramnetwork.json"):
+    def lines_on_edge(self, stop_a, stop_b):
+        return self.base.lines_on_edge(stop_a, stop_b) if self.has_edge(stop_a, stop_b) else []
+
+
+def _decode(mask, names):
+    """
+    The names whose ids are the set bits of mask, in id order.
+    """
+    result = []
+    while mask:
+        low = mask & -mask
+        result.append(names[low.bit_length() - 1])
+        mask ^= low
+    return result
+
+
+def build_tram_network(json_file="tramnetwork.json", use_cache=None, cache_dir=None):
     """
     Constructs a TramNetwork object from a JSON file.
+
+    The network is cached in cache_dir, by default CACHE_DIR, keyed on the
+    path of the JSON file, a hash of its contents and CODE_DIGEST, and
+    loaded from there while the key still matches; a damaged cache file is
+    removed and rebuilt, while other errors in loading it are raised. Pass
+    use_cache=False, or set the environment variable TRAM_NO_CACHE, to
+    always rebuild.
+    """
+    if use_cache is None:
+        use_cache = not os.environ.get('TRAM_NO_CACHE')
+    with open(json_file, 'rb') as file:
+        content = file.read()
+
+    if use_cache:
+        cache_file = _cache_file(json_file, content, cache_dir or CACHE_DIR)
+        try:
+            with open(cache_file, 'rb') as file:
+                return pickle.load(file)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            try:
+                os.remove(cache_file)  # damaged, or of classes that have moved since
+            except OSError:
+                pass
+
+    tram_network = tram_network_from_dict(json.loads(content.decode('utf-8')))
+    if use_cache:
+        _write_cache(cache_file, tram_network)
+    return tram_network
+
+
+def _code_digest():
+    """
+    A hash of __version__ and the source of this module and of graphs, whose
+    classes are pickled, so that changing them changes the cache key even
+    when __version__ is not bumped.
     """
-    with open(json_file, 'r', encoding='utf-8') as file:
-        data = json.load(file)
+    digest = hashlib.sha256(__version__.encode())
+    for module in (sys.modules[__name__], sys.modules[WeightedGraph.__module__]):
+        with open(module.__file__, 'rb') as file:
+            digest.update(file.read())
+    return digest.digest()
+
+
+CODE_DIGEST = _code_digest()
+
 
+def _cache_file(json_file, content, directory):
+    key = hashlib.sha256(content + CODE_DIGEST).hexdigest()[:32]
+    # networks from JSON files of the same name in different places are cached side by side
+    place = hashlib.sha256(os.path.abspath(json_file).encode('utf-8')).hexdigest()[:8]
+    stem = os.path.splitext(os.path.basename(json_file))[0]
+    return os.path.join(directory, f"{stem}-{place}-{key}.pickle")
+
+
+def _write_cache(cache_file, tram_network):
+    """
+    Replace the cached network atomically, so that concurrent readers see
+    either the old file or the complete new one, and drop stale entries.
+    A cache that cannot be written is silently skipped.
+    """
+    directory, name = os.path.split(cache_file)
+    stem = name.rsplit('-', 1)[0]
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                pickle.dump(tram_network, file, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, cache_file)
+        except BaseException:
+            os.remove(tmp)
+            raise
+        for other in os.listdir(directory):
+            if other != name and other.endswith('.pickle') and other.rsplit('-', 1)[0] == stem:
+                os.remove(os.path.join(directory, other))
+    except OSError:
+        pass
+
+
+def tram_network_from_dict(data):
+    """
+    Constructs a TramNetwork from a dictionary in the lab1 JSON format.
+    Stops and lines get consecutive ids in the order they are listed, and
+    every stop, line and time is visited once.
+
+    The result is the same as adding each line with add_line() and then
+    each time with set_transition_time(), but every edge is given its
+    final weight first and all edges are inserted in one operation.
+    """
     tram_network = TramNetwork()
+    weights = {}
+
+    def set_weight(stop_a, stop_b, weight):
+        edge = (stop_b, stop_a) if (stop_b, stop_a) in weights else (stop_a, stop_b)
+        weights[edge] = weight
 
     # Add stops to the network
-    for stop_name, stop_data in data["stops"].items():
+    for stop_id, (stop_name, stop_data) in enumerate(data["stops"].items()):
         position = (stop_data["lat"], stop_data["lon"])
-        stop = TramStop(name=stop_name, position=position)
-        tram_network.add_stop(stop)
+        tram_network.add_stop(TramStop(name=stop_name, position=position, id=stop_id))
 
     # Add lines and their respective stops
-    for line_name, stops in data["lines"].items():
-        line = TramLine(name=f"Line {line_name}")
+    for line_id, (line_name, stops) in enumerate(data["lines"].items()):
+        line = TramLine(name=f"Line {line_name}", id=line_id)
         for stop_name in stops:
             stop = tram_network.stops[stop_name]
             line.add_stop(stop)
-            stop.add_line(f"Line {line_name}")
-        tram_network.add_line(line)
+            stop.add_line(line.get_name())
+        tram_network.add_line(line, add_edges=False)
+        line_stops = line.get_stops()
+        for stop_a, stop_b in zip(line_stops, line_stops[1:]):
+            set_weight(stop_a.get_name(), stop_b.get_name(), 1)
 
-    # Add transition times between stops
+    # Transition times override the default weights of line edges
     for stop_a, connections in data["times"].items():
         for stop_b, time in connections.items():
-            tram_network.set_transition_time(stop_a, stop_b, time)
+            set_weight(stop_a, stop_b, time)
+
+    tram_network.add_weighted_edges_from((a, b, weight) for (a, b), weight in weights.items())
+    tram_network._version += 1  # networkx does not go through the methods that count changes
+    tram_network.compute_geometry()
 
     return tram_network
 
@@ -126,7 +774,7 @@ def export_to_graphviz(network, filename="tram_network"):
     dot = Digraph(name=filename, format="png")
 
     # Add nodes (stops)
-    for stop_name in network.list_all_stops():
+    for stop_name in network.all_stops():
         dot.node(stop_name)
 
     # Add edges (connections between stops)
@@ -141,7 +789,7 @@ def export_to_graphviz(network, filename="tram_network"):
 
 # Example Usage
 if __name__ == "__main__":
-    network = build_tram_network()
+    network = build_tram_network(use_cache='--no-cache' not in sys.argv[1:])
     print("Tram network loaded with stops:", network.list_all_stops())
     print("And lines:", network.list_all_lines())
 
@@ -0,0 +1,33 @@
+import gc
+import threading
+from django.apps import AppConfig
+from django.core.signals import request_started
+
+
+class TramConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'tram'
+
+    def ready(self):
+        # load the tram network once per process, before the first request;
+        # if static/tramnetwork.json is not in place yet, the first request loads it
+        from .utils.trams import network_registry
+        try:
+            network_registry.network()
+        except OSError:
+            return
+        if network_registry.shared:
+            # when the server forks its workers after loading the app (gunicorn --preload),
+            # the objects made so far are left alone by the garbage collector, so that
+            # collecting in the workers does not copy the pages they are on
+            gc.freeze()
+        # the most searched routes are computed in the background once the process
+        # serves its first request, so not in migrate, other commands or the reloader
+        request_started.connect(start_warm_up, dispatch_uid='tram_warm_up')
+
+
+def start_warm_up(**kwargs):
+    # only the request that disconnects the receiver starts the thread
+    if request_started.disconnect(dispatch_uid='tram_warm_up'):
+        from .utils.tramviz import warm_up_from_file
+        threading.Thread(target=warm_up_from_file, daemon=True).start()
@@ -0,0 +1,64 @@
+# stop name completion for the route search form, served by views.stop_names
+
+import threading
+import unicodedata
+
+from .trams import network_registry
+
+
+def fold(text):
+    """
+    The text without case and accents, so that 'ostra' matches 'Östra'.
+    """
+    decomposed = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+class StopTrie:
+    """
+    A prefix tree of stop names, keyed by their folded characters.
+    Each node is a dict from a character to the next node; the names
+    ending at a node are kept under the key None.
+    """
+    def __init__(self, names):
+        self.root = {}
+        for name in names:
+            node = self.root
+            for c in fold(name):
+                node = node.setdefault(c, {})
+            node.setdefault(None, []).append(name)
+
+    def complete(self, prefix, limit=10):
+        """
+        At most limit names starting with prefix, in alphabetical order of
+        their folded form; shorter names come before their extensions.
+        """
+        node = self.root
+        for c in fold(prefix):
+            if c not in node:
+                return []
+            node = node[c]
+        result = []
+        stack = [node]
+        while stack and len(result) < limit:
+            node = stack.pop()
+            result.extend(sorted(node.get(None, [])))
+            stack.extend(node[c] for c in sorted((c for c in node if c is not None), reverse=True))
+        return result[:limit]
+
+
+_current = (None, None)  # (network version, StopTrie)
+_lock = threading.Lock()
+
+
+def current_stop_trie():
+    """
+    The trie of the stops of the current network, built once per version.
+    """
+    global _current
+    version = network_registry.version()
+    if _current[0] != version:
+        with _lock:
+            if _current[0] != version:
+                _current = (version, StopTrie(network_registry.network().all_stops()))
+    return _current[1]
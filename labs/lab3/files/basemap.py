@@ -0,0 +1,92 @@
+# the network map of the home page, served compressed and with validators
+
+import gzip
+import hashlib
+import os
+import threading
+from collections import namedtuple
+
+try:
+    import brotli  # optional: without it only gzip is offered
+except ImportError:
+    brotli = None
+
+from .color_tram_svg import GBG_TRAMNET_SVG
+
+# content codings in order of preference, with their file suffixes
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+MapVariants = namedtuple('MapVariants', ['mtime', 'digest', 'bodies'])
+
+
+def _compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def _available(encoding):
+    return encoding != 'br' or brotli is not None
+
+
+def compress_map(path=GBG_TRAMNET_SVG):
+    """
+    Write the compressed variants of the map next to it, as path.br and
+    path.gz. Returns the sizes of the map and the variants.
+    """
+    with open(path, 'rb') as file:
+        data = file.read()
+    sizes = {'identity': len(data)}
+    for encoding, suffix in ENCODINGS:
+        if _available(encoding):
+            compressed = _compress(data, encoding)
+            with open(path + suffix, 'wb') as file:
+                file.write(compressed)
+            sizes[encoding] = len(compressed)
+    return sizes
+
+
+_current = None
+_lock = threading.Lock()
+
+
+def map_variants(path=GBG_TRAMNET_SVG):
+    """
+    The map and its compressed variants in memory, read again only when
+    the map file changes. Variants that compress_map() has not written,
+    or that are older than the map, are compressed here once.
+    """
+    global _current
+    mtime = os.stat(path).st_mtime
+    if _current is None or _current.mtime != mtime:
+        with _lock:
+            if _current is None or _current.mtime != mtime:
+                with open(path, 'rb') as file:
+                    data = file.read()
+                bodies = {'identity': data}
+                for encoding, suffix in ENCODINGS:
+                    if os.path.exists(path + suffix) and os.stat(path + suffix).st_mtime >= mtime:
+                        with open(path + suffix, 'rb') as file:
+                            bodies[encoding] = file.read()
+                    elif _available(encoding):
+                        bodies[encoding] = _compress(data, encoding)
+                _current = MapVariants(mtime, hashlib.sha256(data).hexdigest()[:32], bodies)
+    return _current
+
+
+def choose_encoding(accept_encoding, bodies):
+    """
+    The preferred content coding that the client accepts and we have.
+    """
+    accepted = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        q = params.strip()[2:] if params.strip().startswith('q=') else '1'
+        try:
+            accepted[name.strip().lower()] = float(q)
+        except ValueError:
+            pass
+    for encoding, _ in ENCODINGS:
+        if encoding in bodies and accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return 'identity'
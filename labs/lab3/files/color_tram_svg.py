@@ -1,22 +1,26 @@
-# path visualization with direct colouring of SVG file: DON'T CHANGE
+# path visualization with direct colouring of SVG file
 
 import os
+from functools import lru_cache
 from django.conf import settings
 
 GBG_TRAMNET_SVG = os.path.join(settings.BASE_DIR,
                         'tram/templates/tram/images/gbg_tramnet.svg')
 
-SHORTEST_PATH_SVG = os.path.join(settings.BASE_DIR,
-                        'tram/templates/tram/images/shortest_path.svg')
-
 # to color SVG directly; specialized to SVG produced from graphviz
 
 import xml.etree.ElementTree as et
 
-def color_svg_network(
-        infile=GBG_TRAMNET_SVG,
-        outfile=SHORTEST_PATH_SVG,
-        colormap=lambda v: 'white'):
+FILL = '\0'  # stands for a fill value in the template; cannot occur in XML
+
+
+@lru_cache(maxsize=None)
+def svg_template(infile=GBG_TRAMNET_SVG):
+    """
+    Parse the SVG file once and serialize it with a FILL mark in place of
+    the fill of every stop polygon. Returns the UTF-8 pieces between the
+    marks and, for each mark, the stop whose colour goes there.
+    """
     tree = et.parse(infile)
     root = tree.getroot()
     ns = '{http://www.w3.org/2000/svg}'
@@ -27,7 +31,7 @@ def color_svg_network(
             stop = g.find(ns+'title').text
             for p in g.iter():
                 if p.tag[-7:] == 'polygon':
-                    p.set('fill', colormap(stop))
+                    p.set('fill', FILL + stop + FILL)
     xns = '{http://www.w3.org/1999/xlink}'
     lxns = len(xns)
     for elem in root.iter():
@@ -35,9 +39,71 @@ def color_svg_network(
         for k, v in elem.items():
             if k[:lxns] == xns:
                 elem.set(k[lxns:], v)
-#                del elem[k]
 
-    tree.write(outfile)
+    # the marks split the text into piece, stop, piece, stop, ..., piece
+    parts = et.tostring(root, encoding='unicode').split(FILL)
+    stops = [et.fromstring(f'<t>{stop}</t>').text for stop in parts[1::2]]
+    return tuple(part.encode('utf-8') for part in parts[0::2]), tuple(stops)
+
+
+def color_svg_network(
+        infile=GBG_TRAMNET_SVG,
+        colormap=lambda v: 'white',
+        template=None):
+    """
+    The SVG of the network as UTF-8 bytes, each stop filled with colormap(stop).
+    Only the fill values are filled in to the cached template; nothing is
+    written to disk, so concurrent requests do not interfere.
+    A template other than svg_template(infile) can be given, such as the
+    one in the shared network file, whose pieces are views of the file.
+    """
+    pieces, stops = template or svg_template(infile)
+    colors = {}
+    parts = [pieces[0]]
+    for stop, piece in zip(stops, pieces[1:]):
+        if stop not in colors:
+            colors[stop] = colormap(stop).encode('utf-8')
+        parts.append(colors[stop])
+        parts.append(piece)
+    return b''.join(parts)
+
+
+@lru_cache(maxsize=None)
+def svg_element_ids(infile=GBG_TRAMNET_SVG):
+    """
+    The id of the node group of each stop, and the ids of the edge groups
+    of each pair of neighbouring stops (one per line running between them).
+    """
+    ns = '{http://www.w3.org/2000/svg}'
+    nodes, edges = {}, {}
+    for g in et.parse(infile).getroot().iter(ns+'g'):
+        if g.get('class') == 'node':
+            nodes[g.find(ns+'title').text] = g.get('id')
+        elif g.get('class') == 'edge':
+            a, _, b = g.find(ns+'title').text.partition('--')
+            edges.setdefault(frozenset((a, b)), []).append(g.get('id'))
+    return nodes, edges
+
+
+def overlay_network(stop_colors, segment_colors, infile=GBG_TRAMNET_SVG):
+    """
+    The changes to make to the SVG for the given fills of stops and strokes
+    of segments (frozensets of two stops), by element id:
+    {'stops': {node id: fill}, 'edges': {edge id: stroke}}.
+    """
+    nodes, edges = svg_element_ids(infile)
+    return {'stops': {nodes[stop]: color for stop, color in stop_colors.items() if stop in nodes},
+            'edges': {edge: color for segment, color in segment_colors.items()
+                      for edge in edges.get(segment, [])}}
+
+
+def overlay_css(overlay):
+    """
+    An overlay from overlay_network() as a style sheet for the SVG.
+    """
+    rules = [f"#{node} polygon {{ fill: {color}; }}" for node, color in overlay['stops'].items()]
+    rules += [f"#{edge} path {{ stroke: {color}; }}" for edge, color in overlay['edges'].items()]
+    return '\n'.join(rules) + '\n'
 
 """
 <!-- Svingeln -->
@@ -22,15 +22,14 @@ gbg_linecolors = {
 
 
 # compute the scale of the map; you may want to test different heuristics to make map look better
+# the network precomputes the bounding box and planar positions in km, so this only scales them
 def scaled_position(network):
-    minlat, minlon, maxlat, maxlon = network.extreme_positions()
-    size_x = maxlon - minlon
+    size_x, size_y = network.projected_size()
     scalefactor = len(network)/4  # heuristic
     x_factor = scalefactor/size_x
-    size_y = maxlat - minlat
     y_factor = scalefactor/size_y
     
-    return lambda xy: (x_factor*(xy[0]-minlon), y_factor*(xy[1]-minlat))
+    return lambda xy: (x_factor*xy[0], y_factor*xy[1])
 
 # Bonus task 2: create a json file that returns the actual traffic information, and rerun the map creation
 
@@ -47,11 +46,12 @@ def stop_url(stop):
 def network_graphviz(network, outfile=MY_GBG_SVG, positions=scaled_position):
     dot = graphviz.Graph(engine='fdp', graph_attr={'size': '12,12'})
 
+    scale = positions(network) if positions else None
     for stop in network.all_stops():
         
-        x, y = network.stop_position(stop)
-        if positions:
-            x, y = positions(network)((x, y))
+        x, y = network.projected_position(stop)
+        if scale:
+            x, y = scale((x, y))
         pos_x, pos_y = str(x), str(y)
         
         col = 'white'
@@ -0,0 +1,193 @@
+# live departures from the stops, for the bonus part of Lab 3
+
+import asyncio
+import atexit
+import json
+import os
+import re
+import threading
+import time
+
+import aiohttp
+from django.conf import settings
+
+# the URLs of the stops collected in the bonus task; each contains stopAreaGid=<gid>
+TRAM_URL_FILE = os.path.join(settings.BASE_DIR, 'static/tram-url.json')
+
+# where departures are asked for; the stub server in departures_stub.py answers the same paths
+DEPARTURES_URL = getattr(settings, 'DEPARTURES_URL',
+                         'https://ext-api.vasttrafik.se/pr/v4/stop-areas/{gid}/departures')
+DEPARTURES_TOKEN = getattr(settings, 'DEPARTURES_TOKEN', None)
+
+# without a token or a URL of its own, the real API would only answer 401 Unauthorized
+DEPARTURES_CONFIGURED = DEPARTURES_TOKEN is not None or hasattr(settings, 'DEPARTURES_URL')
+
+
+class DeparturesUnavailable(Exception):
+    """
+    The departures server could not be reached or did not answer in time.
+    """
+
+
+def stop_gids(url_file=TRAM_URL_FILE):
+    """
+    The stop area gid of each stop, read from the URLs of the bonus task.
+    """
+    if not os.path.exists(url_file):
+        return {}
+    with open(url_file, encoding='utf-8') as file:
+        urls = json.load(file)
+    gids = {}
+    for stop, url in urls.items():
+        match = re.search(r'stopAreaGid=(\d+)', url) or re.search(r'hallplatser/(\d+)', url)
+        if match:
+            gids[stop] = match.group(1)
+    return gids
+
+
+class DeparturesClient:
+    """
+    An asyncio client for the departures of stops, to be used in one event
+    loop as 'async with DeparturesClient() as client'.
+
+    - All requests share one HTTP session, so connections are kept alive
+      and reused, at most `connections` at a time.
+    - Concurrent requests for the same stop are coalesced: only the first
+      one goes out, as a task of its own that all of them wait for, so a
+      caller that gives up does not cancel it for the others.
+    - Answers are cached per stop for `ttl` seconds.
+    """
+    def __init__(self, url=DEPARTURES_URL, token=DEPARTURES_TOKEN, ttl=30, connections=10, timeout=5):
+        self.url = url
+        self.token = token
+        self.ttl = ttl
+        self.connections = connections
+        self.timeout = timeout
+        self._session = None
+        self._cache = {}  # gid -> (time fetched, departures)
+        self._pending = {}  # gid -> task of the request under way
+        self.fetches = self.hits = self.coalesced = 0
+
+    async def __aenter__(self):
+        headers = {'Authorization': f'Bearer {self.token}'} if self.token else {}
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.connections),
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            headers=headers)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self._session.close()
+
+    async def departures(self, gid):
+        """
+        The departures from the stop area gid, as the server returns them.
+        """
+        cached = self._cache.get(gid)
+        if cached and time.monotonic() - cached[0] < self.ttl:
+            self.hits += 1
+            return cached[1]
+        task = self._pending.get(gid)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(gid))
+            self._pending[gid] = task
+            task.add_done_callback(lambda task: self._fetched(gid, task))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    async def _fetch(self, gid):
+        self.fetches += 1
+        async with self._session.get(self.url.format(gid=gid)) as response:
+            response.raise_for_status()
+            result = await response.json()
+        self._cache[gid] = (time.monotonic(), result)
+        return result
+
+    def _fetched(self, gid, task):
+        del self._pending[gid]
+        if not task.cancelled():
+            task.exception()  # retrieved here, in case nobody was waiting any more
+
+    async def prefetch(self, gids):
+        """
+        Fetch the departures of many stops at once, for instance all the stops
+        of a route. Returns {gid: departures} for those that succeeded.
+        """
+        gids = list(dict.fromkeys(gids))
+        results = await asyncio.gather(*(self.departures(gid) for gid in gids), return_exceptions=True)
+        return {gid: result for gid, result in zip(gids, results) if not isinstance(result, Exception)}
+
+    def stats(self):
+        return {'fetches': self.fetches, 'hits': self.hits, 'coalesced': self.coalesced,
+                'cached': len(self._cache)}
+
+
+class BackgroundDepartures:
+    """
+    A DeparturesClient running in an event loop of its own thread, so that
+    the synchronous Django views of all requests share its connections,
+    pending requests and cache.
+    """
+    def __init__(self, **client_options):
+        self.client_options = client_options
+        self._lock = threading.Lock()
+        self._loop = None
+        self._client = None
+        self.gids = stop_gids()
+
+    def _start(self):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, daemon=True).start()
+                self._client = asyncio.run_coroutine_threadsafe(
+                    DeparturesClient(**self.client_options).__aenter__(), loop).result()
+                self._loop = loop
+                atexit.register(self._stop)
+        return self._loop
+
+    def _stop(self):
+        asyncio.run_coroutine_threadsafe(self._client.__aexit__(None, None, None), self._loop).result(1)
+
+    def departures(self, stop, timeout=10):
+        """
+        The departures from a stop, waiting for them at most timeout seconds.
+        Stops without a known gid raise KeyError, and failed or late
+        answers DeparturesUnavailable.
+        """
+        gid = self.gids[stop]
+        loop = self._start()
+        future = asyncio.run_coroutine_threadsafe(self._client.departures(gid), loop)
+        try:
+            return future.result(timeout)
+        except (aiohttp.ClientError, asyncio.TimeoutError, TimeoutError) as error:
+            future.cancel()
+            raise DeparturesUnavailable(f"No departures for {stop}: {error}") from error
+
+    def prefetch(self, stops):
+        """
+        Start fetching the departures of the stops without waiting for them.
+        """
+        gids = [self.gids[stop] for stop in stops if stop in self.gids]
+        if gids:
+            loop = self._start()
+            asyncio.run_coroutine_threadsafe(self._client.prefetch(gids), loop)
+
+    def stats(self):
+        return self._client.stats() if self._client else {}
+
+
+_background = None
+_background_lock = threading.Lock()
+
+
+def background_departures():
+    """
+    The BackgroundDepartures of this process, started on first use.
+    """
+    global _background
+    with _background_lock:
+        if _background is None:
+            _background = BackgroundDepartures()
+    return _background
@@ -0,0 +1,66 @@
+# a local stand-in for the departures API, replaying recorded answers
+#
+#   python departures_stub.py departures_recorded.json --port 8765
+#
+# and in settings.py
+#
+#   DEPARTURES_URL = 'http://127.0.0.1:8765/pr/v4/stop-areas/{gid}/departures'
+
+import argparse
+import asyncio
+import json
+from collections import Counter
+
+from aiohttp import web
+
+RECORDED_FILE = 'departures_recorded.json'
+
+
+def stub_app(recordings, delay=0.0):
+    """
+    An aiohttp application answering /pr/v4/stop-areas/<gid>/departures with
+    recordings[gid] after delay seconds, and 404 for unknown gids. The number
+    of requests per gid is kept in app['requests'].
+    """
+    requests = Counter()
+
+    async def departures(request):
+        gid = request.match_info['gid']
+        requests[gid] += 1
+        await asyncio.sleep(delay)
+        if gid not in recordings:
+            raise web.HTTPNotFound()
+        return web.json_response(recordings[gid])
+
+    app = web.Application()
+    app['requests'] = requests
+    app.router.add_get('/pr/v4/stop-areas/{gid}/departures', departures)
+    return app
+
+
+async def start_stub(recordings, port=0, delay=0.0):
+    """
+    Run the stub in the current event loop. Returns the runner, to be
+    cleaned up with 'await runner.cleanup()', and the URL template for
+    DeparturesClient.
+    """
+    runner = web.AppRunner(stub_app(recordings, delay))
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', port)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f'http://127.0.0.1:{port}/pr/v4/stop-areas/{{gid}}/departures'
+
+
+def load_recordings(path=RECORDED_FILE):
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve recorded departures.")
+    parser.add_argument('recordings', nargs='?', default=RECORDED_FILE)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--delay', type=float, default=0.0, help="seconds before each answer")
+    args = parser.parse_args()
+    web.run_app(stub_app(load_recordings(args.recordings), args.delay), host='127.0.0.1', port=args.port)
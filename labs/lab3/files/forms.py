@@ -0,0 +1,25 @@
+from django import forms
+from .models import Route
+from .utils.trams import network_registry
+
+
+class RouteForm(forms.ModelForm):
+    # not stored in Route: with a departure time, the quickest path follows the timetable
+    departure = forms.TimeField(required=False, widget=forms.TimeInput(attrs={'type': 'time'}),
+                                help_text="Optional, HH:MM.")
+
+    class Meta:
+        model = Route
+        fields = ('dep', 'dest',)
+
+    def clean(self):
+        """
+        Stops that are not in the network are errors of their fields.
+        """
+        cleaned_data = super().clean()
+        network = network_registry.network()
+        for field in ('dep', 'dest'):
+            stop = cleaned_data.get(field)
+            if stop and stop not in network:
+                self.add_error(field, f"Unknown stop: {stop}")
+        return cleaned_data
@@ -0,0 +1,20 @@
+import time
+from django.core.management.base import BaseCommand
+
+from ...utils.route_table import ROUTE_TABLE_FILE, build_route_table
+
+
+class Command(BaseCommand):
+    help = ("Precompute the quickest and shortest routes between all stops into "
+            "static/routetable.bin, which find_route then uses instead of searching.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=None,
+                            help="number of worker processes, default one per CPU")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        stops, vertices = build_route_table(processes=options['processes'])
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"Routes between {stops} stops ({vertices} stop-line vertices) "
+                          f"saved to {ROUTE_TABLE_FILE} in {elapsed:.1f} s")
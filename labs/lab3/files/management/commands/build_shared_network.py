@@ -0,0 +1,16 @@
+import time
+from django.core.management.base import BaseCommand
+
+from ...utils.shared_network import SHARED_NETWORK_FILE, write_shared_network
+
+
+class Command(BaseCommand):
+    help = ("Write the network and the map template to sharednetwork.bin, "
+            "which the server workers map and share when TRAM_SHARED_NETWORK = True.")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        size = write_shared_network()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"Shared network of {size} bytes saved to {SHARED_NETWORK_FILE} "
+                          f"in {elapsed:.1f} s")
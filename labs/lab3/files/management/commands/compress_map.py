@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from ...utils.basemap import compress_map
+from ...utils.color_tram_svg import GBG_TRAMNET_SVG
+
+
+class Command(BaseCommand):
+    help = "Write the gzip and brotli variants of the network map that the home page serves."
+
+    def handle(self, *args, **options):
+        sizes = compress_map()
+        self.stdout.write(f"{GBG_TRAMNET_SVG}: " +
+                          ', '.join(f"{encoding} {size} bytes" for encoding, size in sizes.items()))
@@ -0,0 +1,154 @@
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+from ...utils.trams import NetworkRegistry, network_registry
+from ...utils.tramviz import show_shortest, show_overlay, route_cache, search_log
+from ...utils.timing import recording
+
+
+def zipf_pairs(stops, n, exponent, seed):
+    """
+    n (dep, dest) pairs where the k:th most popular stop is chosen with a
+    weight of 1 / k**exponent, so that a few pairs repeat often as in real
+    traffic; the popularity order is a random permutation of the stops.
+    """
+    rng = random.Random(seed)
+    ranked = rng.sample(stops, len(stops))
+    weights = [1 / (k + 1) ** exponent for k in range(len(ranked))]
+    pairs = []
+    while len(pairs) < n:
+        dep, dest = rng.choices(ranked, weights, k=2)
+        if dep != dest:
+            pairs.append((dep, dest))
+    return pairs
+
+
+def percentile(sorted_values, p):
+    """
+    The nearest-rank p:th percentile of a sorted list.
+    """
+    k = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[k]
+
+
+def allowed_host():
+    """
+    A host name that settings.ALLOWED_HOSTS lets through, for the test client.
+    """
+    for host in settings.ALLOWED_HOSTS:
+        if host != '*':
+            return host.lstrip('.')
+    return 'localhost'
+
+
+class Command(BaseCommand):
+    help = ("Send route searches concurrently and report throughput, latency "
+            "percentiles and the time spent in each phase, as JSON.")
+
+    TARGETS = ('find_route', 'show_shortest', 'show_overlay')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', choices=self.TARGETS, default='find_route',
+                            help="the view through the test client, or a function directly")
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16],
+                            help="numbers of threads to run with, one run each")
+        parser.add_argument('--zipf', type=float, default=1.0,
+                            help="skew of the stop popularity; 0 is uniform")
+        parser.add_argument('--cold', action='store_true', help="disable the route cache")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="file for the JSON report, default stdout")
+
+    def handle(self, *args, **options):
+        # the network loaded by a registry of its own, as a new server process does
+        start = time.perf_counter()
+        NetworkRegistry(network_registry.tramfile, network_registry.shared).network()
+        load_time = time.perf_counter() - start
+        stops = network_registry.network().list_all_stops()
+        pairs = zipf_pairs(stops, options['requests'], options['zipf'], options['seed'])
+        request = self.request_function(options['target'])
+
+        # the synthetic searches are not logged, so they do not become the popular routes
+        maxsize, log_path = route_cache.maxsize, search_log.path
+        search_log.path = None
+        if options['cold']:
+            route_cache.maxsize = 0
+        try:
+            runs = [self.run(request, pairs, threads, options['cold']) for threads in options['concurrency']]
+        finally:
+            route_cache.maxsize, search_log.path = maxsize, log_path
+
+        report = {'target': options['target'], 'requests': len(pairs), 'distinct_pairs': len(set(pairs)),
+                  'zipf': options['zipf'], 'cold': options['cold'],
+                  'network_load_ms': load_time * 1000, 'runs': runs}
+        text = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                file.write(text + '\n')
+        else:
+            self.stdout.write(text)
+
+    def request_function(self, target):
+        if target == 'show_shortest':
+            return lambda dep, dest: show_shortest(dep, dest)
+        if target == 'show_overlay':
+            return lambda dep, dest: show_overlay(dep, dest)
+
+        # one test client per thread, as each browser has its own
+        clients = threading.local()
+
+        def find_route(dep, dest):
+            if not hasattr(clients, 'client'):
+                clients.client = Client(HTTP_HOST=allowed_host())
+            response = clients.client.post('/route/', {'dep': dep, 'dest': dest})
+            if response.status_code != 200:
+                raise RuntimeError(f"{dep} - {dest}: status {response.status_code}")
+        return find_route
+
+    def run(self, request, pairs, threads, cold):
+        """
+        Send all the requests on a pool of threads; returns the statistics of the run.
+        """
+        if not cold:
+            route_cache.clear()
+
+        def timed(pair):
+            with recording() as phases:
+                start = time.perf_counter()
+                try:
+                    request(*pair)
+                    error = None
+                except Exception as exception:
+                    error = exception
+                latency = time.perf_counter() - start
+            return latency, dict(phases), error
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            results = list(pool.map(timed, pairs))
+        elapsed = time.perf_counter() - start
+
+        latencies = sorted(latency for latency, _, error in results if error is None)
+        errors = [error for _, _, error in results if error is not None]
+        for error in errors[:3]:
+            self.stderr.write(str(error))
+        phases = {}
+        for _, recorded, _ in results:
+            for name, seconds in recorded.items():
+                phases[name] = phases.get(name, 0.0) + seconds
+        stats = route_cache.stats()
+        return {
+            'concurrency': threads,
+            'throughput_per_s': len(latencies) / elapsed,
+            'latency_ms': {name: percentile(latencies, p) * 1000 if latencies else None
+                           for name, p in (('p50', 50), ('p95', 95), ('p99', 99), ('max', 100))},
+            'phases_ms': {name: seconds / len(results) * 1000 for name, seconds in phases.items()},
+            'cache_hit_rate': stats['hit_rate'],
+            'errors': len(errors),
+        }
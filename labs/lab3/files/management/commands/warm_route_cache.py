@@ -0,0 +1,25 @@
+import json
+import time
+from django.core.management.base import BaseCommand
+
+from ...utils.tramviz import POPULAR_ROUTES_FILE, route_cache, search_log, warm_up
+
+
+class Command(BaseCommand):
+    help = ("Save the most searched routes to static/popular_routes.json; "
+            "the server computes them into its route cache when it starts.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=50, help="number of routes to save")
+
+    def handle(self, *args, **options):
+        pairs = [[dep, dest] for (dep, dest), _ in search_log.counts().most_common(options['top'])]
+        with open(POPULAR_ROUTES_FILE, 'w', encoding='utf-8') as file:
+            json.dump(pairs, file, indent=2, ensure_ascii=False)
+
+        # computing them here checks the stops and shows how long a warm-up takes
+        start = time.perf_counter()
+        warm_up(pairs)
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f"Saved {len(pairs)} routes to {POPULAR_ROUTES_FILE}; "
+                          f"{route_cache.stats()['size']} computed in {elapsed:.2f} s")
@@ -0,0 +1,200 @@
+# all-pairs quickest and shortest routes, precomputed by manage.py build_route_table
+
+import hashlib
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+
+from .graphs import dijkstra
+from .trams import (TRAM_FILE, build_tram_network, specialize_stops_to_lines,
+                    specialized_transition_time, specialized_geo_distance)
+
+ROUTE_TABLE_FILE = os.path.join(settings.BASE_DIR, 'static/routetable.bin')
+
+# route table file: magic, sha256 of the network JSON, stop count, vertex count,
+# size of the name table, change time and change distance the routes were computed with
+TABLE_MAGIC = b'ROUTES\x01\0'
+TABLE_HEADER = struct.Struct('<8s32sIIIdd')
+
+LAYERS = ('quickest', 'shortest')
+
+ARRIVED = -1  # next hop of a vertex at the destination
+UNREACHABLE = -2
+
+
+def file_digest(path):
+    with open(path, 'rb') as file:
+        return hashlib.sha256(file.read()).digest()
+
+
+def layer_cost(spec_network, layer, changetime, changedistance):
+    if layer == 'quickest':
+        return lambda a, b: specialized_transition_time(spec_network, a, b, changetime)
+    return lambda a, b: specialized_geo_distance(spec_network, a, b, changedistance)
+
+
+# state of each worker process, set once by _init_worker
+_worker = {}
+
+
+def _init_worker(tramfile, vertices, changetime, changedistance):
+    spec_network = specialize_stops_to_lines(build_tram_network(tramfile))
+    _worker['spec_network'] = spec_network
+    _worker['vertices'] = vertices
+    _worker['index'] = {vertex: i for i, vertex in enumerate(vertices)}
+    _worker['costs'] = {layer: layer_cost(spec_network, layer, changetime, changedistance)
+                        for layer in LAYERS}
+
+
+def _routes_to(dest):
+    """
+    For one destination stop and each layer, the next hop and the cost from
+    every (stop, line) vertex towards it. Costs are symmetric, so the
+    search runs backwards from the destination: in the path from dest to
+    a vertex, the vertex before it is its next hop.
+    """
+    spec_network, vertices, index = _worker['spec_network'], _worker['vertices'], _worker['index']
+    result = []
+    for layer in LAYERS:
+        cost = _worker['costs'][layer]
+        paths = dijkstra(spec_network, dest, cost=cost)
+        hops, costs = array('i'), array('f')
+        for vertex in vertices:
+            path = paths.get(vertex)
+            if path is None:
+                hops.append(UNREACHABLE)
+                costs.append(math.inf)
+            else:
+                hops.append(ARRIVED if len(path) == 2 else index[path[-2]])
+                costs.append(sum(cost(a, b) for a, b in zip(path, path[1:])))
+        result.append((hops, costs))
+    return result
+
+
+def build_route_table(tramfile=TRAM_FILE, outfile=ROUTE_TABLE_FILE,
+                      changetime=10, changedistance=0.02, processes=None):
+    """
+    Compute the quickest and the shortest routes between all stops, one
+    destination per task on a process pool, and save them to outfile.
+
+    The file holds a header, the stop and vertex names as JSON, and for
+    each layer the int32 next hops and the float32 costs of every
+    (destination, vertex) pair, destination-major.
+    """
+    network = build_tram_network(tramfile)
+    stops = network.list_all_stops()
+    vertices = [(stop, line) for stop in stops for line in network.lines_via_stop(stop)]
+    with ProcessPoolExecutor(processes, initializer=_init_worker,
+                             initargs=(tramfile, vertices, changetime, changedistance)) as pool:
+        results = list(pool.map(_routes_to, stops, chunksize=8))
+
+    layers = []
+    for i in range(len(LAYERS)):
+        hops, costs = array('i'), array('f')
+        for result in results:
+            hops.extend(result[i][0])
+            costs.extend(result[i][1])
+        if sys.byteorder != 'little':
+            hops.byteswap()
+            costs.byteswap()
+        layers.append((hops, costs))
+
+    names = json.dumps({'stops': stops, 'vertices': vertices}, ensure_ascii=False).encode('utf-8')
+    names += b' ' * (-len(names) % 4)
+    tmp = outfile + '.tmp'
+    with open(tmp, 'wb') as file:
+        file.write(TABLE_HEADER.pack(TABLE_MAGIC, file_digest(tramfile), len(stops), len(vertices),
+                                     len(names), changetime, changedistance))
+        file.write(names)
+        for hops, costs in layers:
+            file.write(hops.tobytes())
+            file.write(costs.tobytes())
+    os.replace(tmp, outfile)
+    return len(stops), len(vertices)
+
+
+class RouteTable:
+    """
+    A route table written by build_route_table(), memory-mapped and read
+    in place: a route is found by following next hops, in time
+    proportional to its length.
+    """
+    def __init__(self, path=ROUTE_TABLE_FILE):
+        with open(path, 'rb') as file:
+            self._mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.digest, n_stops, n_vertices, names_size,
+         self.changetime, self.changedistance) = TABLE_HEADER.unpack_from(self._mm)
+        if magic != TABLE_MAGIC:
+            raise ValueError(f"{path} is not a route table.")
+        offset = TABLE_HEADER.size
+        names = json.loads(self._mm[offset:offset + names_size].decode('utf-8'))
+        offset += names_size
+        self.stops = {stop: i for i, stop in enumerate(names['stops'])}
+        self.vertices = [tuple(vertex) for vertex in names['vertices']]
+        self.stop_vertices = {}
+        for i, (stop, _) in enumerate(self.vertices):
+            self.stop_vertices.setdefault(stop, []).append(i)
+
+        self.layers = {}
+        size = n_stops * n_vertices
+        with memoryview(self._mm) as buf:
+            for layer in LAYERS:
+                columns = []
+                for code in 'if':
+                    column = buf[offset:offset + 4 * size].cast(code)
+                    if sys.byteorder != 'little':
+                        column = array(code, column)
+                        column.byteswap()
+                    columns.append(column)
+                    offset += 4 * size
+                self.layers[layer] = columns
+        self._n_vertices = n_vertices
+
+    def route(self, dep, dest, layer):
+        """
+        The path [dep, (dep, line), ..., (dest, line)] and its cost, as
+        a search from dep in tramviz.py finds it, or (None, None) if dest
+        cannot be reached. Unknown stops raise KeyError.
+        """
+        hops, costs = self.layers[layer]
+        row = self.stops[dest] * self._n_vertices
+        start = min(self.stop_vertices[dep], key=lambda v: costs[row + v])
+        if hops[row + start] == UNREACHABLE:
+            return None, None
+        path = [dep]
+        v = start
+        while v != ARRIVED:
+            path.append(self.vertices[v])
+            v = hops[row + v]
+        cost = costs[row + start]
+        return path, int(cost) if cost.is_integer() else cost  # whole minutes stay ints
+
+
+_current = (None, None)  # (network version, RouteTable or None)
+_lock = threading.Lock()
+
+
+def current_route_table(version, tramfile=TRAM_FILE, path=ROUTE_TABLE_FILE):
+    """
+    The route table for the given network version, or None if there is none
+    or it was computed from a different network file. The file is checked
+    again only when the network version changes.
+    """
+    global _current
+    if _current[0] != version:
+        with _lock:
+            if _current[0] != version:
+                table = None
+                if os.path.exists(path):
+                    table = RouteTable(path)
+                    if table.digest != file_digest(tramfile):
+                        table = None
+                _current = (version, table)
+    return _current[1]
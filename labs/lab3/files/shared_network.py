@@ -0,0 +1,277 @@
+# the tram network and the map template in one memory-mapped file, so that the
+# worker processes of a pre-fork server share them instead of each building its own;
+# used when settings.py has TRAM_SHARED_NETWORK = True, written by manage.py build_shared_network
+
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+
+from django.conf import settings
+from haversine import haversine
+
+from .trams import TRAM_FILE, TramNetwork, FrozenTramNetwork, build_tram_network, _decode
+from .color_tram_svg import GBG_TRAMNET_SVG, svg_template
+from .route_table import file_digest
+
+# next to the database rather than in static/, whose files are served to anyone
+SHARED_NETWORK_FILE = os.path.join(settings.BASE_DIR, 'sharednetwork.bin')
+
+# shared network file: magic, sha256 of the network JSON and of the map SVG, numbers of
+# stops, lines, adjacency entries, stops of all lines and template marks, size of the
+# name table and size of the template text
+SHARED_MAGIC = b'TRAMSHM\x01'
+SHARED_HEADER = struct.Struct('<8s32s32sIIIIIII')
+
+# the columns after the name table, in file order: (name, type code, length)
+# 8-byte columns come first so that every column is aligned
+def _columns(n_stops, n_lines, n_entries, n_line_stops, n_marks):
+    return [('bbox', 'd', 4), ('x', 'd', n_stops), ('y', 'd', n_stops),
+            ('lat', 'd', n_stops), ('lon', 'd', n_stops), ('stop_lines', 'Q', n_stops),
+            ('adj_weights', 'd', n_entries), ('adj_lengths', 'd', n_entries), ('edge_lines', 'Q', n_entries),
+            ('adj_offsets', 'i', n_stops + 1), ('adj_targets', 'i', n_entries),
+            ('line_offsets', 'i', n_lines + 1), ('line_members', 'i', n_line_stops),
+            ('piece_offsets', 'i', n_marks + 2)]
+
+
+def write_shared_network(tramfile=TRAM_FILE, svgfile=GBG_TRAMNET_SVG, path=SHARED_NETWORK_FILE):
+    """
+    Build the network and the map template and write them to path, replaced
+    atomically so that processes attaching at the same time see the old or
+    the new file. Returns the number of bytes written.
+
+    The file holds a header, the stop, line and template stop names as JSON,
+    the adjacency of the stops in the compressed form of FrozenTramNetwork
+    with the weight, length and line bitmask of every entry, the positions
+    of the stops, the stops of every line and the UTF-8 template pieces.
+    """
+    network = build_tram_network(tramfile).freeze()
+    stops = list(network.names)
+    lines = network.list_all_lines()
+    if len(lines) > 64:
+        raise ValueError("The shared network file has room for at most 64 lines.")
+    index = {stop: i for i, stop in enumerate(stops)}
+    bits = {line: 1 << j for j, line in enumerate(lines)}
+
+    def line_mask(names):
+        mask = 0
+        for line in names:
+            mask |= bits[line]
+        return mask
+
+    columns = {'bbox': array('d', network.extreme_positions())}
+    columns['x'], columns['y'] = array('d'), array('d')
+    columns['lat'], columns['lon'] = array('d'), array('d')
+    columns['stop_lines'] = array('Q')
+    for stop in stops:
+        x, y = network.projected_position(stop)
+        lat, lon = network.stop_position(stop)
+        for name, value in (('x', x), ('y', y), ('lat', lat), ('lon', lon)):
+            columns[name].append(value)
+        columns['stop_lines'].append(line_mask(network.lines_via_stop(stop)))
+    columns['adj_offsets'], columns['adj_targets'] = network.adj_offsets, network.adj_targets
+    columns['adj_weights'], columns['adj_lengths'] = network.adj_weights, network.adj_lengths
+    columns['edge_lines'] = array('Q')
+    for i, stop in enumerate(stops):
+        for k in range(network.adj_offsets[i], network.adj_offsets[i + 1]):
+            other = stops[network.adj_targets[k]]
+            columns['edge_lines'].append(line_mask(network.lines_on_edge(stop, other)))
+    columns['line_offsets'], columns['line_members'] = array('i', [0]), array('i')
+    for line in lines:
+        columns['line_members'].extend(index[stop] for stop in network.line_stops(line))
+        columns['line_offsets'].append(len(columns['line_members']))
+
+    pieces, marks = svg_template(svgfile)
+    columns['piece_offsets'] = array('i', [0])
+    for piece in pieces:
+        columns['piece_offsets'].append(columns['piece_offsets'][-1] + len(piece))
+    text = b''.join(pieces)
+
+    names = json.dumps({'stops': stops, 'lines': lines, 'marks': marks}, ensure_ascii=False).encode('utf-8')
+    names += b' ' * (-(SHARED_HEADER.size + len(names)) % 8)
+    header = SHARED_HEADER.pack(SHARED_MAGIC, file_digest(tramfile), file_digest(svgfile),
+                                len(stops), len(lines), len(network.adj_targets), len(columns['line_members']),
+                                len(marks), len(names), len(text))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(header)
+            file.write(names)
+            for name, code, _ in _columns(len(stops), len(lines), len(network.adj_targets),
+                                          len(columns['line_members']), len(marks)):
+                column = array(code, columns[name])
+                if sys.byteorder != 'little':
+                    column.byteswap()
+                file.write(column.tobytes())
+            file.write(text)
+            size = file.tell()
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+    return size
+
+
+class SharedNetwork:
+    """
+    A shared network file, memory-mapped read-only. Its columns are used in
+    place, so the pages are shared by all processes that map the file, and
+    by the workers forked from a process that did: only the names, and the
+    small dictionaries to look them up, are Python objects of each process.
+    """
+    def __init__(self, path=SHARED_NETWORK_FILE):
+        with open(path, 'rb') as file:
+            self._mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.network_digest, self.svg_digest, n_stops, n_lines, n_entries, n_line_stops,
+         n_marks, names_size, text_size) = SHARED_HEADER.unpack_from(self._mm)
+        if magic != SHARED_MAGIC:
+            raise ValueError(f"{path} is not a shared network file.")
+        offset = SHARED_HEADER.size
+        names = json.loads(self._mm[offset:offset + names_size].decode('utf-8'))
+        offset += names_size
+
+        columns = {}
+        buf = memoryview(self._mm)
+        for name, code, length in _columns(n_stops, n_lines, n_entries, n_line_stops, n_marks):
+            size = array(code).itemsize * length
+            column = buf[offset:offset + size].cast(code)
+            if sys.byteorder != 'little':
+                column = array(code, column)
+                column.byteswap()
+            columns[name] = column
+            offset += size
+        text = buf[offset:offset + text_size]
+
+        starts = columns.pop('piece_offsets')
+        self.svg_template = (tuple(text[a:b] for a, b in zip(starts, starts[1:])), tuple(names['marks']))
+        self.network = MappedTramNetwork(names['stops'], names['lines'], columns, self.svg_template)
+
+
+class MappedTramNetwork:
+    """
+    The read-only part of the FrozenTramNetwork interface that the web
+    application uses, answered from the columns of a SharedNetwork instead
+    of a graph. Stops and lines are numbered in the order of the file; bit
+    j of a line mask stands for line j.
+    """
+    def __init__(self, stops, lines, columns, svg_template=None):
+        self.names = tuple(stops)
+        self.index = {stop: i for i, stop in enumerate(self.names)}
+        self._line_names = tuple(lines)
+        self._line_index = {line: j for j, line in enumerate(self._line_names)}
+        for name, column in columns.items():
+            setattr(self, name, column)
+        # the entry of every edge, which routing looks up for each edge it relaxes
+        self._entries = {(stop, self.names[self.adj_targets[k]]): k
+                         for i, stop in enumerate(self.names)
+                         for k in range(self.adj_offsets[i], self.adj_offsets[i + 1])}
+        self.svg_template = svg_template  # the map template stored with the network
+
+    # these only need edge_line_mask(), _line_names and the adjacency columns
+    lines_on_edge = TramNetwork.lines_on_edge
+    path_legs = TramNetwork.path_legs
+    shortest_path = FrozenTramNetwork.shortest_path
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, stop_name):
+        return stop_name in self.index
+
+    def _stop(self, stop_name):
+        if stop_name not in self.index:
+            raise KeyError(f"Stop {stop_name} does not exist in the network.")
+        return self.index[stop_name]
+
+    def _entry(self, stop_a, stop_b):
+        """
+        The position of the edge from stop_a to stop_b in the adjacency columns, or None.
+        """
+        return self._entries.get((stop_a, stop_b))
+
+    def all_stops(self):
+        return self.index.keys()
+
+    def all_lines(self):
+        return self._line_index.keys()
+
+    def list_all_stops(self):
+        return list(self.names)
+
+    def list_all_lines(self):
+        return list(self._line_names)
+
+    def lines_via_stop(self, stop_name):
+        return _decode(self.stop_lines[self._stop(stop_name)], self._line_names)
+
+    def line_stops(self, line_name):
+        j = self._line_index[line_name]
+        return [self.names[i] for i in self.line_members[self.line_offsets[j]:self.line_offsets[j + 1]]]
+
+    def neighbors(self, vertex, as_list=False):
+        i = self.index[vertex]
+        neighbors = [self.names[j] for j in self.adj_targets[self.adj_offsets[i]:self.adj_offsets[i + 1]]]
+        return neighbors if as_list else tuple(neighbors)
+
+    def has_edge(self, stop_a, stop_b):
+        return self._entry(stop_a, stop_b) is not None
+
+    def get_weight(self, stop_a, stop_b):
+        k = self._entry(stop_a, stop_b)
+        if k is None:
+            return None  # as WeightedGraph.get_weight()
+        weight = self.adj_weights[k]
+        return int(weight) if weight.is_integer() else weight  # whole minutes stay ints
+
+    transition_time = get_weight
+
+    def geo_distance(self, stop_a, stop_b):
+        k = self._entry(stop_a, stop_b)
+        if k is not None:
+            return self.adj_lengths[k]
+        return haversine(self.stop_position(stop_a), self.stop_position(stop_b))
+
+    def stop_position(self, stop_name):
+        i = self._stop(stop_name)
+        return self.lat[i], self.lon[i]
+
+    def line_bit(self, line_name):
+        return 1 << self._line_index[line_name]
+
+    def edge_line_mask(self, stop_a, stop_b):
+        k = self._entry(stop_a, stop_b)
+        return 0 if k is None else self.edge_lines[k]
+
+    def extreme_positions(self):
+        return tuple(self.bbox)
+
+    def projected_position(self, stop_name):
+        i = self._stop(stop_name)
+        return self.x[i], self.y[i]
+
+    def projected_size(self):
+        return max(self.x, default=0), max(self.y, default=0)
+
+    def freeze(self):
+        return self
+
+
+def open_shared_network(tramfile=TRAM_FILE, svgfile=GBG_TRAMNET_SVG, path=SHARED_NETWORK_FILE):
+    """
+    Map the shared network file, after writing it first if it is missing or
+    was written from other network or map files.
+    """
+    digests = file_digest(tramfile), file_digest(svgfile)
+    try:
+        shared = SharedNetwork(path)
+        if (shared.network_digest, shared.svg_digest) == digests:
+            return shared
+    except (OSError, ValueError, struct.error):
+        pass
+    write_shared_network(tramfile, svgfile, path)
+    return SharedNetwork(path)
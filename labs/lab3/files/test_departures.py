@@ -0,0 +1,110 @@
+import asyncio
+import threading
+import unittest
+
+import aiohttp
+
+from .departures import DeparturesClient, BackgroundDepartures, DeparturesUnavailable
+from .departures_stub import start_stub
+
+RECORDINGS = {'9021014001960000': {'results': [{'line': '6', 'time': '12:03'}]},
+              '9021014001760000': {'results': [{'line': '7', 'time': '12:05'}]}}
+CHALMERS = '9021014001960000'
+
+
+class TestDeparturesClient(unittest.IsolatedAsyncioTestCase):
+    async def start(self, delay=0.0, **options):
+        runner, url = await start_stub(RECORDINGS, delay=delay)
+        self.addAsyncCleanup(runner.cleanup)
+        self.requests = runner.app['requests']
+        client = DeparturesClient(url=url, **options)
+        await client.__aenter__()
+        self.addAsyncCleanup(client.__aexit__, None, None, None)
+        return client
+
+    async def test_departures(self):
+        client = await self.start()
+        self.assertEqual(await client.departures(CHALMERS), RECORDINGS[CHALMERS])
+
+    async def test_coalesced(self):
+        client = await self.start(delay=0.2)
+        results = await asyncio.gather(*(client.departures(CHALMERS) for _ in range(5)))
+        self.assertEqual(results, [RECORDINGS[CHALMERS]] * 5)
+        self.assertEqual(self.requests[CHALMERS], 1)
+        self.assertEqual((client.fetches, client.coalesced), (1, 4))
+
+    async def test_cached_for_ttl(self):
+        client = await self.start(ttl=30)
+        await client.departures(CHALMERS)
+        await client.departures(CHALMERS)
+        self.assertEqual(self.requests[CHALMERS], 1)
+        self.assertEqual(client.hits, 1)
+
+    async def test_fetched_again_after_ttl(self):
+        client = await self.start(ttl=0)
+        await client.departures(CHALMERS)
+        await client.departures(CHALMERS)
+        self.assertEqual(self.requests[CHALMERS], 2)
+        self.assertEqual(client.hits, 0)
+
+    async def test_timeout(self):
+        client = await self.start(delay=1.0, timeout=0.2)
+        with self.assertRaises(asyncio.TimeoutError):
+            await client.departures(CHALMERS)
+        self.assertEqual(client.stats()['cached'], 0)
+
+    async def test_unknown_stop(self):
+        client = await self.start()
+        with self.assertRaises(aiohttp.ClientResponseError):
+            await client.departures('1')
+
+    async def test_waiters_served_when_first_caller_gives_up(self):
+        client = await self.start(delay=0.2)
+        first = asyncio.ensure_future(client.departures(CHALMERS))
+        await asyncio.sleep(0.05)
+        waiter = asyncio.ensure_future(client.departures(CHALMERS))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        self.assertEqual(await asyncio.wait_for(waiter, 2), RECORDINGS[CHALMERS])
+        self.assertEqual(self.requests[CHALMERS], 1)
+
+    async def test_prefetch(self):
+        client = await self.start()
+        results = await client.prefetch([CHALMERS, '1', CHALMERS])
+        self.assertEqual(results, {CHALMERS: RECORDINGS[CHALMERS]})
+        self.assertEqual(self.requests[CHALMERS], 1)
+
+
+class TestBackgroundDepartures(unittest.TestCase):
+    def setUp(self):
+        # the stub runs in an event loop of its own thread, like a remote server
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        self.runner, self.url = asyncio.run_coroutine_threadsafe(
+            start_stub(RECORDINGS, delay=0.3), self.loop).result()
+
+    def tearDown(self):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def background(self):
+        background = BackgroundDepartures(url=self.url)
+        background.gids = {'Chalmers': CHALMERS}
+        self.addCleanup(background._stop)
+        return background
+
+    def test_departures(self):
+        self.assertEqual(self.background().departures('Chalmers'), RECORDINGS[CHALMERS])
+
+    def test_late_answer_is_cached_for_the_next_request(self):
+        background = self.background()
+        with self.assertRaises(DeparturesUnavailable):
+            background.departures('Chalmers', timeout=0.1)
+        self.assertEqual(background.departures('Chalmers', timeout=2), RECORDINGS[CHALMERS])
+        self.assertEqual(self.runner.app['requests'][CHALMERS], 1)
+
+    def test_unknown_stop(self):
+        background = BackgroundDepartures(url=self.url)
+        background.gids = {}
+        with self.assertRaises(KeyError):
+            background.departures('Chalmers')
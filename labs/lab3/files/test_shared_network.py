@@ -0,0 +1,95 @@
+import json
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from .trams import TRAM_FILE, build_tram_network, specialize_stops_to_lines
+from .trams import specialized_transition_time, specialized_geo_distance
+from .graphs import pareto_paths
+from .color_tram_svg import GBG_TRAMNET_SVG, color_svg_network
+from .shared_network import SharedNetwork, write_shared_network, open_shared_network
+
+
+class TestSharedNetwork(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "sharednetwork.bin")
+        write_shared_network(TRAM_FILE, GBG_TRAMNET_SVG, self.path)
+        self.shared = SharedNetwork(self.path)
+        self.mapped = self.shared.network
+        self.frozen = build_tram_network(TRAM_FILE, use_cache=False).freeze()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_stops_and_lines(self):
+        self.assertEqual(list(self.mapped.all_stops()), list(self.frozen.all_stops()))
+        self.assertEqual(self.mapped.list_all_lines(), self.frozen.list_all_lines())
+        for stop in self.frozen.all_stops():
+            self.assertEqual(self.mapped.lines_via_stop(stop), self.frozen.lines_via_stop(stop))
+            self.assertEqual(self.mapped.stop_position(stop), self.frozen.stop_position(stop))
+            self.assertEqual(self.mapped.projected_position(stop), self.frozen.projected_position(stop))
+        for line in self.frozen.all_lines():
+            self.assertEqual(self.mapped.line_stops(line), self.frozen.line_stops(line))
+        self.assertEqual(self.mapped.extreme_positions(), tuple(self.frozen.extreme_positions()))
+        self.assertEqual(self.mapped.projected_size(), self.frozen.projected_size())
+
+    def test_edges(self):
+        for stop in self.frozen.all_stops():
+            self.assertEqual(sorted(self.mapped.neighbors(stop)), sorted(self.frozen.neighbors(stop)))
+            for other in self.frozen.neighbors(stop):
+                self.assertEqual(self.mapped.get_weight(stop, other), self.frozen.get_weight(stop, other))
+                self.assertIs(type(self.mapped.get_weight(stop, other)), type(self.frozen.get_weight(stop, other)))
+                self.assertEqual(self.mapped.geo_distance(stop, other), self.frozen.geo_distance(stop, other))
+                self.assertEqual(self.mapped.lines_on_edge(stop, other), self.frozen.lines_on_edge(stop, other))
+        self.assertFalse(self.mapped.has_edge("Chalmers", "Angered Centrum"))
+        self.assertIsNone(self.frozen.get_weight("Chalmers", "Angered Centrum"))
+        self.assertIsNone(self.mapped.get_weight("Chalmers", "Angered Centrum"))
+        self.assertIsNone(self.mapped.get_weight("Chalmers", "Nowhere"))
+        self.assertEqual(self.mapped.edge_line_mask("Chalmers", "Angered Centrum"), 0)
+
+    def test_routes(self):
+        stops = self.frozen.list_all_stops()
+        rng = random.Random(0)
+        for _ in range(100):
+            dep, dest = rng.sample(stops, 2)
+            self.assertEqual(self.mapped.shortest_path(dep, dest), self.frozen.shortest_path(dep, dest))
+            self.assertEqual(self.mapped.shortest_path(dep, dest, layer='length'),
+                             self.frozen.shortest_path(dep, dest, layer='length'))
+            routes = []
+            for network in (self.mapped, self.frozen):
+                spec_network = specialize_stops_to_lines(network)
+                routes.append(pareto_paths(spec_network, dep, spec_network.stop_vertices(dest),
+                    (lambda a, b: specialized_transition_time(spec_network, a, b),
+                     lambda a, b: specialized_geo_distance(spec_network, a, b))))
+            self.assertEqual(routes[0], routes[1])
+
+    def test_svg(self):
+        def colormap(stop):
+            return 'orange' if stop < 'M' else 'white'
+
+        self.assertEqual(color_svg_network(colormap=colormap, template=self.shared.svg_template),
+                         color_svg_network(GBG_TRAMNET_SVG, colormap=colormap))
+
+    def test_rewritten_when_network_changes(self):
+        tramfile = os.path.join(self.directory, "tramnetwork.json")
+        with open(TRAM_FILE, encoding="utf-8") as file:
+            data = json.load(file)
+        with open(tramfile, "w", encoding="utf-8") as file:
+            json.dump(data, file)
+        self.assertEqual(open_shared_network(tramfile, GBG_TRAMNET_SVG, self.path).network.get_weight(
+            "Chalmers", "Korsvägen"), self.frozen.get_weight("Chalmers", "Korsvägen"))
+
+        data["times"]["Chalmers"]["Korsvägen"] = data["times"]["Korsvägen"]["Chalmers"] = 42
+        with open(tramfile, "w", encoding="utf-8") as file:
+            json.dump(data, file)
+        network = open_shared_network(tramfile, GBG_TRAMNET_SVG, self.path).network
+        self.assertEqual(network.get_weight("Chalmers", "Korsvägen"), 42)
+
+    def test_not_a_shared_network(self):
+        with open(self.path, "wb") as file:
+            file.write(b"\0" * 200)
+        with self.assertRaises(ValueError):
+            SharedNetwork(self.path)
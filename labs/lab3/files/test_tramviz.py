@@ -0,0 +1,43 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from .tramviz import SearchLog
+
+
+class TestSearchLog(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "searches.log")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_counts(self):
+        log = SearchLog(self.path)
+        for dep, dest in [("Chalmers", "Korsvägen"), ("Chalmers", "Korsvägen"), ("Brunnsparken", "Chalmers")]:
+            log.add(dep, dest)
+        self.assertEqual(log.counts(), {("Chalmers", "Korsvägen"): 2, ("Brunnsparken", "Chalmers"): 1})
+
+    def test_rotated(self):
+        log = SearchLog(self.path, max_bytes=100)
+        for _ in range(50):
+            log.add("Chalmers", "Korsvägen")
+        self.assertLess(os.path.getsize(self.path), 100)
+        self.assertLess(os.path.getsize(self.path + ".1"), 200)
+        self.assertEqual(sorted(os.listdir(self.directory)), ["searches.log", "searches.log.1"])
+        self.assertLess(log.counts()["Chalmers", "Korsvägen"], 50)
+
+    def test_cut_line_skipped(self):
+        log = SearchLog(self.path)
+        log.add("Chalmers", "Korsvägen")
+        with open(self.path, "a", encoding="utf-8") as file:
+            file.write('["Chalmers", "Korsv')
+        self.assertEqual(log.counts(), {("Chalmers", "Korsvägen"): 1})
+
+    def test_off(self):
+        log = SearchLog(None)
+        log.add("Chalmers", "Korsvägen")
+        self.assertEqual(log.counts(), {})
+        self.assertEqual(os.listdir(self.directory), [])
@@ -0,0 +1,45 @@
+import os
+import unittest
+
+from django.test import SimpleTestCase
+from django.urls import reverse
+
+from .trams import TRAM_LINES_FILE
+from .tramviz import search_log
+
+
+class TestFindRoute(SimpleTestCase):
+    def setUp(self):
+        # the test searches are not logged as popular routes
+        self.log_path = search_log.path
+        search_log.path = None
+
+    def tearDown(self):
+        search_log.path = self.log_path
+
+    def search(self, **data):
+        return self.client.post(reverse('find_route') + '?overlay=json', data)
+
+    def test_route(self):
+        response = self.search(dep='Chalmers', dest='Korsvägen')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['timepath'].startswith('Quickest: Chalmers, Korsvägen'))
+
+    def test_unknown_stop(self):
+        for data in ({'dep': 'Nowhere', 'dest': 'Korsvägen'}, {'dep': 'Chalmers', 'dest': 'Nowhere'}):
+            response = self.search(**data)
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, 'Unknown stop: Nowhere')
+            self.assertTemplateUsed(response, 'tram/find_route.html')
+
+    def test_invalid_departure(self):
+        response = self.search(dep='Chalmers', dest='Korsvägen', departure='25:00')
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'tram/find_route.html')
+        self.assertTrue(response.context['form'].has_error('departure'))
+
+    @unittest.skipUnless(os.path.exists(TRAM_LINES_FILE), "no static/tramlines.txt")
+    def test_departure(self):
+        response = self.search(dep='Chalmers', dest='Angered Centrum', departure='08:15')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('arriving', response.json()['timepath'])
@@ -0,0 +1,120 @@
+# timetable routing for Lab 3: a copy of the functions of the same names in
+# lab1/tramdata.py, without the rest of the Lab 1 dialogue, since the files of the
+# Django app are copied into tram/utils and cannot import from Lab 1;
+# a change to one copy must be made to the other too
+
+from bisect import bisect_left
+
+
+def parse_clock(clock):
+    hour, minute = map(int, clock.split(':'))
+    return hour * 60 + minute
+
+
+def format_clock(minutes):
+    return f"{minutes // 60 % 24:02d}:{minutes % 60:02d}"
+
+
+def build_tram_schedules(linefile):
+    """
+    Read the stops of each line with their clock times in minutes,
+    {line: [(stop, minutes), ...]}, using the same format as build_tram_lines().
+    """
+    schedules = {}
+    current_line = None
+    with open(linefile, 'r', encoding='utf-8') as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            if line.endswith(':'):
+                current_line = line[:-1].strip()
+                schedules[current_line] = []
+            elif current_line is not None:
+                try:
+                    stop, time = line.rsplit(maxsplit=1)
+                    schedules[current_line].append((stop, parse_clock(time)))
+                except ValueError:
+                    continue
+    return schedules
+
+
+def build_timetable(linefile, headway=10, first='05:00', last='24:00'):
+    """
+    Compile the lines into an array of connections sorted by departure time.
+
+    The line file gives one departure per line. It is repeated every
+    headway minutes from first to last, in both directions, with the
+    same running times. Each connection is a tuple
+    (departure, arrival, from_stop, to_stop, line, trip), where the
+    times are minutes after midnight.
+    """
+    connections = []
+    trip = 0
+    for line, schedule in build_tram_schedules(linefile).items():
+        if len(schedule) < 2:
+            continue
+        stops = [stop for stop, _ in schedule]
+        offsets = [minutes - schedule[0][1] for _, minutes in schedule]
+        total = offsets[-1]
+        directions = [(stops, offsets), (stops[::-1], [total - o for o in offsets[::-1]])]
+        for start in range(parse_clock(first), parse_clock(last) + 1, headway):
+            for direction_stops, direction_offsets in directions:
+                for i in range(len(direction_stops) - 1):
+                    connections.append((start + direction_offsets[i], start + direction_offsets[i + 1],
+                                        direction_stops[i], direction_stops[i + 1], line, trip))
+                trip += 1
+    connections.sort()
+    return connections
+
+
+def earliest_arrival(connections, dep, dest, start, change_time=0):
+    """
+    Find the earliest arrival from dep to dest when leaving at start
+    (minutes after midnight), with the Connection Scan Algorithm.
+
+    Returns the journey as a list of legs (line, from_stop, departure, to_stop,
+    arrival), one per tram ridden, or None if dest cannot be reached.
+    change_time is the minimum number of minutes needed to change trams.
+    """
+    if dep == dest:
+        return []
+    ready = {dep: start}   # earliest time a tram can be boarded at each stop
+    arrival = {dep: start}
+    legs = {dep: 0}        # number of trams ridden to reach each stop
+    boarded = {}           # trip -> connection where it was boarded
+    reached_by = {}        # stop -> (boarding connection, alighting connection)
+    for i in range(bisect_left(connections, (start,)), len(connections)):
+        connection = connections[i]
+        departure, arrives, a, b, line, trip = connection
+        if departure >= arrival.get(dest, float('inf')):
+            break
+        if departure >= ready.get(a, float('inf')):
+            # board here, or later on a trip already boarded if that saves changes
+            if trip not in boarded or legs[a] < legs[boarded[trip][2]]:
+                boarded[trip] = connection
+        elif trip not in boarded:
+            continue
+        if arrives < arrival.get(b, float('inf')):
+            arrival[b] = arrives
+            ready[b] = arrives + change_time
+            legs[b] = legs[boarded[trip][2]] + 1
+            reached_by[b] = (boarded[trip], connection)
+
+    if dest not in reached_by:
+        return None
+    legs = []
+    stop = dest
+    while stop != dep:
+        board, alight = reached_by[stop]
+        legs.append((board[4], board[2], board[0], alight[3], alight[1]))
+        stop = board[2]
+    return legs[::-1]
+
+
+def journey_text(legs):
+    """
+    Describe a journey found by earliest_arrival(), one leg per line.
+    """
+    return '; '.join(f"line {line} from {a} {format_clock(d)} to {b} {format_clock(t)}"
+                     for line, a, d, b, t in legs)
@@ -0,0 +1,37 @@
+# per-request timing of the phases of a route search, collected by manage.py loadtest
+
+import threading
+import time
+from contextlib import contextmanager
+
+_local = threading.local()
+
+
+@contextmanager
+def phase(name):
+    """
+    Add the time spent in the block to the named phase, if the current
+    thread is recording; otherwise do nothing.
+    """
+    phases = getattr(_local, 'phases', None)
+    if phases is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases[name] = phases.get(name, 0.0) + time.perf_counter() - start
+
+
+@contextmanager
+def recording():
+    """
+    Record the phases of the code run in the block, in this thread, into
+    the dictionary {phase: seconds} it gives.
+    """
+    _local.phases = phases = {}
+    try:
+        yield phases
+    finally:
+        _local.phases = None
@@ -1,39 +1,254 @@
 # visualization of shortest path in Lab 3, modified to work with Django
 
-from .trams import readTramNetwork
-from .graphs import dijkstra
-from .color_tram_svg import color_svg_network
+from .trams import TRAM_LINES_FILE, network_registry, readTimetable, specialize_stops_to_lines
+from .trams import specialized_transition_time, specialized_geo_distance, specialized_legs
+from .graphs import pareto_paths
+from .timetable import earliest_arrival, journey_text, parse_clock, format_clock
+from .color_tram_svg import color_svg_network, overlay_network
+from .route_table import current_route_table
+from .timing import phase
+import json
 import os
+import threading
+from collections import Counter, OrderedDict
 from django.conf import settings
 
-def show_shortest(dep, dest):
-    # TODO: uncomment this when it works with your own code
-    network = readTramNetwork()
-
-    # TODO: replace this mock-up with actual computation using dijkstra.
-    # First you need to calculate the shortest and quickest paths, by using appropriate
-    # cost functions in dijkstra().
-    # Then you just need to use the lists of stops returned by dijkstra()
-    #
-    # If you do Bonus 1, you could also tell which tram lines you use and where changes
-    # happen. But since this was not mentioned in lab3.md, it is not compulsory.
-
-    quickest = [dep, 'Chalmers', dest]
-    shortest = [dep, 'Chalmers', dest] 
-    
-    timepath = 'Quickest: ' + ', '.join(quickest) + ', 5 minutes'
-    geopath = 'Shortest: ' + ', '.join(shortest) + ', 100 km'
-
-    def colors(v):
-        if v in shortest:
-            return 'cyan'
+# the most searched (dep, dest) pairs, written by manage.py warm_route_cache
+POPULAR_ROUTES_FILE = os.path.join(settings.BASE_DIR, 'static/popular_routes.json')
+
+# every search made in find_route, which manage.py warm_route_cache counts
+SEARCH_LOG_FILE = os.path.join(settings.BASE_DIR, 'searches.log')
+
+
+def route_text(path):
+    stops = []
+    for stop, _ in path[1:]:
+        if not stops or stops[-1] != stop:
+            stops.append(stop)
+    legs = ', '.join(f"{line} {a} - {b}" for line, a, b in specialized_legs(path))
+    return ', '.join(stops) + (f' ({legs})' if legs else ''), stops
+
+
+class RouteCache:
+    """
+    A bounded LRU cache of show_shortest() results, shared by the threads
+    of one process. Keys include the network version, so the results for
+    an old network are never returned after a reload; they just age out.
+    """
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._results:
+                self.hits += 1
+                self._results.move_to_end(key)
+                return self._results[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, result):
+        with self._lock:
+            self._results[key] = result
+            self._results.move_to_end(key)
+            while len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses,
+                    'hit_rate': self.hits / lookups if lookups else 0.0,
+                    'size': len(self._results), 'maxsize': self.maxsize}
+
+
+route_cache = RouteCache()
+
+
+class SearchLog:
+    """
+    The searches of all the threads and processes of the server, appended
+    to a file as one JSON line [dep, dest] each: a single small write per
+    search, instead of a database row. A path of None turns it off.
+
+    When the file grows past max_bytes, it is renamed to path + '.1',
+    replacing the older one, so at most about twice max_bytes of the
+    latest searches are kept, and read by counts().
+    """
+    def __init__(self, path=SEARCH_LOG_FILE, max_bytes=1000000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def add(self, dep, dest):
+        with self._lock:
+            if self.path is None:
+                return
+            # opened for each search, so that a file renamed by another process is not written to
+            with open(self.path, 'a', encoding='utf-8') as file:
+                file.write(json.dumps([dep, dest], ensure_ascii=False) + '\n')
+                full = file.tell() >= self.max_bytes
+            if full:
+                try:
+                    os.replace(self.path, self.path + '.1')
+                except OSError:
+                    pass  # renamed by another process at the same time
+
+    def counts(self):
+        """
+        How many times each (dep, dest) pair was searched, as a Counter.
+        """
+        counts = Counter()
+        if self.path is None:
+            return counts
+        for path in (self.path + '.1', self.path):
+            if not os.path.exists(path):
+                continue
+            with open(path, encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        dep, dest = json.loads(line)
+                    except ValueError:
+                        continue  # a line cut short
+                    counts[dep, dest] += 1
+        return counts
+
+
+search_log = SearchLog()
+
+
+def show_shortest(dep, dest, departure=None, changetime=10, changedistance=0.02):
+    """
+    The quickest and shortest path texts and the coloured SVG bytes,
+    from the route cache when the same question was asked before.
+    """
+    return _cached(dep, dest, departure, changetime, changedistance, overlay=False)
+
+
+def show_overlay(dep, dest, departure=None, changetime=10, changedistance=0.02):
+    """
+    As show_shortest(), but instead of the SVG only the colours to change in
+    the base map: {'stops': {node id: fill}, 'edges': {edge id: stroke}}.
+    """
+    return _cached(dep, dest, departure, changetime, changedistance, overlay=True)
+
+
+def _cached(dep, dest, departure, changetime, changedistance, overlay):
+    key = (dep, dest, network_registry.version(), departure, changetime, changedistance, overlay)
+    result = route_cache.get(key)
+    if result is None:
+        result = _show_shortest(dep, dest, departure, changetime, changedistance, overlay)
+        route_cache.put(key, result)
+    return result
+
+
+def warm_up(pairs):
+    """
+    Compute the routes between the given (dep, dest) pairs into the cache;
+    pairs with unknown stops are skipped. Only the show_overlay() results
+    that find_route uses are warmed: show_shortest() results, with their
+    whole SVG, start cold, so that they do not fill the cache.
+    """
+    for dep, dest in pairs:
+        try:
+            show_overlay(dep, dest)
+        except (KeyError, ValueError):
+            pass
+
+
+def warm_up_from_file(path=POPULAR_ROUTES_FILE):
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as file:
+            warm_up(json.load(file))
+
+
+def _show_shortest(dep, dest, departure, changetime, changedistance, overlay):
+    with phase('network'):
+        version = network_registry.version()
+        network = network_registry.network()
+    with phase('routing'):
+        timepath, geopath, quickest, shortest = _find_paths(
+            network, version, dep, dest, departure, changetime, changedistance)
+
+    with phase('svg'):
+        def colors(v):
+            if v in quickest and v in shortest:
+                return 'cyan'
+            elif v in shortest:
+                return 'lightgreen'
+            elif v in quickest:
+                return 'orange'
+            else:
+                return 'white'
+
+        if overlay:
+            # the segments of the paths are coloured in the same way as their stops
+            quick_segments = {frozenset(pair) for pair in zip(quickest, quickest[1:])}
+            short_segments = {frozenset(pair) for pair in zip(shortest, shortest[1:])}
+            segments = {segment: 'cyan' if segment in quick_segments and segment in short_segments
+                        else 'lightgreen' if segment in short_segments else 'orange'
+                        for segment in quick_segments | short_segments}
+            stops = {stop: colors(stop) for stop in set(quickest) | set(shortest)}
+            return timepath, geopath, overlay_network(stops, segments)
+
+        # the SVG image with your shortest path colors, made in memory for this request
+        # (a shared network carries the map template, which the workers then share too)
+        svg = color_svg_network(colormap=colors, template=getattr(network, 'svg_template', None))
+        # return the path texts and the image to be shown in the web page
+        return timepath, geopath, svg
+
+
+def _find_paths(network, version, dep, dest, departure, changetime, changedistance):
+    """
+    The quickest and shortest path texts and the stops of the two paths.
+    """
+    # quickest path with transition times as costs, shortest with geographic distances,
+    # both with a penalty for changing lines; looked up in the precomputed
+    # route table (manage.py build_route_table) when it matches the network
+    table = current_route_table(version)
+    if table and (table.changetime, table.changedistance) == (changetime, changedistance):
+        quickest, minutes = table.route(dep, dest, 'quickest')
+        shortest, km = table.route(dep, dest, 'shortest')
+    else:
+        # one bi-criteria search: its first route is the quickest, its last the shortest
+        spec_network = specialize_stops_to_lines(network)
+        routes = pareto_paths(spec_network, dep, spec_network.stop_vertices(dest),
+            (lambda a, b: specialized_transition_time(spec_network, a, b, changetime),
+             lambda a, b: specialized_geo_distance(spec_network, a, b, changedistance)))
+        if routes:
+            (minutes, _), quickest = routes[0]
+            (_, km), shortest = routes[-1]
         else:
-            return 'white'
-            
+            quickest = shortest = None
+    if quickest is None:
+        # dest cannot be reached from dep, for instance after a change to the network
+        no_route = f'no route from {dep} to {dest}'
+        return 'Quickest: ' + no_route, 'Shortest: ' + no_route, [], []
+    quickest_text, quickest = route_text(quickest)
+    shortest_text, shortest = route_text(shortest)
+
+    timepath = 'Quickest: ' + quickest_text + f', {minutes} minutes'
+    geopath = 'Shortest: ' + shortest_text + f', {km:.1f} km'
 
-    # this part should be left as it is:
-    # change the SVG image with your shortest path colors
-    color_svg_network(colormap=colors)
-    # return the path texts to be shown in the web page
-    return timepath, geopath
+    # with a departure time ('HH:MM'), the quickest path follows the timetable
+    # of static/tramlines.txt, when there is one
+    if departure and os.path.exists(TRAM_LINES_FILE):
+        legs = earliest_arrival(readTimetable(), dep, dest, parse_clock(departure))
+        if legs:
+            quickest = [dep]
+            for line, a, _, b, _ in legs:
+                stops = network.line_stops('Line ' + line)
+                i, j = stops.index(a), stops.index(b)
+                quickest += stops[i + 1:j + 1] if i < j else stops[j:i][::-1]
+            timepath = 'Quickest: ' + journey_text(legs) + f', arriving {format_clock(legs[-1][4])}'
 
+    return timepath, geopath, quickest, shortest
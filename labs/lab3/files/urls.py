@@ -0,0 +1,11 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('', views.tram_net, name='home'),
+    path('map.svg', views.base_map, name='base_map'),
+    path('route/', views.find_route, name='find_route'),
+    path('route/stats/', views.route_cache_stats, name='route_cache_stats'),
+    path('tram/stops', views.stop_names, name='stop_names'),
+    path('departures/<str:stop>/', views.stop_departures, name='stop_departures'),
+    ]
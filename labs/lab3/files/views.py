@@ -1,22 +1,100 @@
 from django.shortcuts import render
+from django.http import HttpResponse, JsonResponse, Http404
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from django.views.decorators.clickjacking import xframe_options_sameorigin
 from .forms import RouteForm
 from django.shortcuts import redirect
 
-from .utils.tramviz import show_shortest
+from .utils.tramviz import show_overlay, route_cache, search_log
+from .utils.color_tram_svg import overlay_css, svg_element_ids
+from .utils.departures import background_departures, DeparturesUnavailable, DEPARTURES_CONFIGURED
+from .utils.timing import phase
+from .utils.autocomplete import current_stop_trie
+from .utils.basemap import map_variants, choose_encoding
+
+MAX_COMPLETIONS = 50
 
 def tram_net(request):
     return render(request, 'tram/home.html', {})
 
 
+@xframe_options_sameorigin  # the home page embeds it
+def base_map(request):
+    """
+    The network map, compressed as the browser accepts, with validators so
+    that a browser that has it gets an empty 304 answer.
+    """
+    variants = map_variants()
+    encoding = choose_encoding(request.headers.get('Accept-Encoding', ''), variants.bodies)
+    etag = f'"{variants.digest}-{encoding}"'  # each coding is a different representation
+    response = get_conditional_response(request, etag=etag, last_modified=int(variants.mtime))
+    if response is None:
+        response = HttpResponse(variants.bodies[encoding], content_type='image/svg+xml')
+        if encoding != 'identity':
+            response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(variants.mtime)
+    patch_vary_headers(response, ['Accept-Encoding'])
+    patch_cache_control(response, no_cache=True)  # always ask, usually to get a 304
+    return response
+
+
 def find_route(request):
     form = RouteForm()
     if request.method == "POST":
         form = RouteForm(request.POST)
         if form.is_valid():
-            route = form.data
-            timepath, geopath = show_shortest(route['dep'], route['dest'])
-            return render(request, 'tram/show_route.html',
-                {'route': form.instance.__str__(), 'timepath': timepath, 'geopath': geopath})
+            route = form.cleaned_data
+            departure = route['departure'].strftime('%H:%M') if route['departure'] else None
+            # only the colour changes are sent; the page shows them on the cached base map,
+            # and ?overlay=json or ?overlay=css return just them
+            timepath, geopath, overlay = show_overlay(route['dep'], route['dest'], departure)
+            # the departures of the stops on the map are likely to be clicked next
+            if DEPARTURES_CONFIGURED:
+                stops_by_node = {node: stop for stop, node in svg_element_ids()[0].items()}
+                background_departures().prefetch(stops_by_node[node] for node in overlay['stops'])
+            if request.GET.get('overlay') == 'json':
+                response = JsonResponse({'timepath': timepath, 'geopath': geopath, **overlay})
+            elif request.GET.get('overlay') == 'css':
+                response = HttpResponse(overlay_css(overlay), content_type='text/css')
+            else:
+                with phase('render'):
+                    response = render(request, 'tram/show_route.html',
+                        {'route': form.instance.__str__(), 'timepath': timepath, 'geopath': geopath,
+                         'overlay_css': overlay_css(overlay)})
+            # the searches are counted by manage.py warm_route_cache
+            search_log.add(route['dep'], route['dest'])
+            return response
     else:
         form = RouteForm()
     return render(request, 'tram/find_route.html', {'form': form})
+
+
+def route_cache_stats(request):
+    return JsonResponse(route_cache.stats())
+
+
+def stop_names(request):
+    """
+    The stops starting with ?prefix=, ignoring case and accents, at most ?limit= of them.
+    """
+    prefix = request.GET.get('prefix', '')
+    try:
+        limit = min(int(request.GET.get('limit', 10)), MAX_COMPLETIONS)
+    except ValueError:
+        limit = 10
+    stops = current_stop_trie().complete(prefix, limit) if prefix else []
+    return JsonResponse({'stops': stops})
+
+
+def stop_departures(request, stop):
+    """
+    The live departures from a stop, from the cache if they were asked for recently.
+    """
+    try:
+        return JsonResponse(background_departures().departures(stop))
+    except KeyError:
+        raise Http404(f"No departures known for {stop}")
+    except DeparturesUnavailable as error:
+        return JsonResponse({'error': str(error)}, status=502)
@@ -1,24 +1,34 @@
-function autocomplete(inp, arr) {
+function autocomplete(inp, url) {
   /*the autocomplete function takes two arguments,
-  the text field element and an array of possible autocompleted values:*/
+  the text field element and the URL of the server's stop name completion,
+  which returns {"stops": [...]} for ?prefix=:*/
   var currentFocus;
+  var latest = 0;
   /*execute a function when someone writes in the text field:*/
   inp.addEventListener("input", function(e) {
-      var a, b, i, val = this.value;
+      var val = this.value, request = ++latest;
       /*close any already open lists of autocompleted values*/
       closeAllLists();
       if (!val) { return false;}
       currentFocus = -1;
+      fetch(url + "?limit=10&prefix=" + encodeURIComponent(val))
+        .then(function(response) { return response.json(); })
+        .then(function(data) {
+          /*ignore answers to earlier keystrokes that arrive late:*/
+          if (request == latest) { showList(val, data.stops); }
+        });
+  });
+  function showList(val, arr) {
+      var a, b, i;
+      closeAllLists();
       /*create a DIV element that will contain the items (values):*/
       a = document.createElement("DIV");
-      a.setAttribute("id", this.id + "autocomplete-list");
+      a.setAttribute("id", inp.id + "autocomplete-list");
       a.setAttribute("class", "autocomplete-items");
       /*append the DIV element as a child of the autocomplete container:*/
-      this.parentNode.appendChild(a);
-      /*for each item in the array...*/
+      inp.parentNode.appendChild(a);
+      /*for each item in the array, all of which start with the text field value:*/
       for (i = 0; i < arr.length; i++) {
-        /*check if the item starts with the same letters as the text field value:*/
-        if (arr[i].substr(0, val.length).toUpperCase() == val.toUpperCase()) {
           /*create a DIV element for each matching element:*/
           b = document.createElement("DIV");
           /*make the matching letters bold:*/
@@ -35,9 +45,8 @@ function autocomplete(inp, arr) {
               closeAllLists();
           });
           a.appendChild(b);
-        }
       }
-  });
+  }
   /*execute a function presses a key on the keyboard:*/
   inp.addEventListener("keydown", function(e) {
       var x = document.getElementById(this.id + "autocomplete-list");
@@ -95,8 +104,7 @@ document.addEventListener("click", function (e) {
 });
 }
 
-var stops =
-["Allhelgonakyrkan", "Almedal", "Angered Centrum", "Aprilgatan", "Axel Dahlströms Torg", "Bellevue", "Berzeliigatan", "Beväringsgatan", "Bokekullsgatan", "Botaniska Trädgården", "Briljantgatan", "Brunnsgatan", "Brunnsparken", "Bäckeliden", "Bögatan", "Centralstationen", "Chalmers", "Chapmans Torg", "Doktor Fries Torg", "Doktor Sydows Gata", "Domkyrkan", "Ejdergatan", "Ekedal", "Eketrägatan", "Ekmanska", "Elisedal", "Fjällgatan", "Frihamnen", "Friskväderstorget", "Frölunda Torg Spårvagn", "Galileis Gata", "Gamlestads Torg", "Godhemsgatan", "Gropegårdsgatan", "Grönsakstorget", "Hagakyrkan", "Hagen", "Hammarkullen", "Handelshögskolan", "Hinsholmen", "Hjalmar Brantingsplatsen", "Hjällbo", "Härlanda", "Högsbogatan", "Jaegerdorffsplatsen", "Januarigatan", "Järntorget", "Kaggeledstorget", "Kapellplatsen", "Kaptensgatan", "Klintens Väg", "Komettorget", "Korsvägen", "Kortedala Torg", "Krokslätts Fabriker", "Krokslätts torg", "Kungsportsplatsen", "Kungssten", "Kviberg", "Käringberget", "Lackarebäck", "Lana", "Lantmilsgatan", "Lilla Bommen", "Linnéplatsen", "Liseberg Station", "Liseberg Södra", "Långedrag", "Majvallen", "Mariaplan", "Marklandsgatan", "Masthuggstorget", "Medicinaregatan", "Mildvädersgatan", "Munkebäckstorget", "Musikvägen", "Mölndals Innerstad", "Mölndals sjukhus", "Nordstan", "Nya Varvsallén", "Nymilsgatan", "Nymånegatan", "Olivedalsgatan", "Olskrokstorget", "Opaltorget", "Ostindiegatan", "Positivgatan", "Prinsgatan", "Rambergsvallen", "Redbergsplatsen", "Roddföreningen", "Runstavsgatan", "Rymdtorget Spårvagn", "SKF", "Sahlgrenska Huvudentré", "Saltholmen", "Sanatoriegatan", "Sandarna", "Sankt Sigfrids Plan", "Sannaplan", "Scandinavium", "Seminariegatan", "Smaragdgatan", "Solrosgatan", "Stenpiren", "Stigbergstorget", "Stockholmsgatan", "Storås", "Svingeln", "Sälöfjordsgatan", "Teleskopgatan", "Temperaturgatan", "Tingvallsvägen", "Tranered", "Töpelsgatan", "Ullevi Norra", "Ullevi Södra", "Vagnhallen Majorna", "Valand", "Varbergsgatan", "Varmfrontsgatan", "Vasa Viktoriagatan", "Vasaplatsen", "Virginsgatan", "Väderilsgatan", "Vågmästareplatsen", "Vårväderstorget", "Wavrinskys Plats", "Welandergatan", "Wieselgrensplatsen", "Ättehögsgatan", "Önskevädersgatan", "Östra Sjukhuset"];
+var STOPS_URL = "/tram/stops";
 
-autocomplete(document.getElementById("myInput"), stops);
-autocomplete(document.getElementById("myInputDest"), stops);
+autocomplete(document.getElementById("myInput"), STOPS_URL);
+autocomplete(document.getElementById("myInputDest"), STOPS_URL);